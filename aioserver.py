@@ -0,0 +1,188 @@
+# aioserver.py
+
+import io
+import asyncio
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from forms import FORM_READ_TIMEOUT
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES   = 1024 * 1024
+IDLE_TIMEOUT     = 15.0
+
+
+class _ServerInfo:
+    """Stand-in for the socketserver object a request handler expects."""
+    def __init__(self, server_address):
+        self.server_address = server_address
+
+
+def _buffered(handler_class):
+    """
+    Subclass handler_class so it reads a complete request from memory and
+    writes its response to memory instead of talking to a socket. This lets
+    the asyncio front end reuse every route of the blocking handler as-is.
+    """
+    class BufferedHandler(handler_class):
+        def __init__(self, raw, client_address, server):
+            self._raw = raw
+            super().__init__(None, client_address, server)
+
+        def setup(self):
+            self.connection = None
+            self.rfile = io.BytesIO(self._raw)
+            self.wfile = io.BytesIO()
+
+        def handle(self):
+            self.handle_one_request()
+
+        def finish(self):
+            pass
+
+    BufferedHandler.__name__ = handler_class.__name__
+    return BufferedHandler
+
+
+def _content_length(head: bytes):
+    """Return the Content-Length of a request head, or None if malformed."""
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        name = name.strip().lower()
+        if name == b'content-length':
+            try:
+                length = int(value.strip())
+            except ValueError:
+                return None
+            return length if length >= 0 else None
+        if name == b'transfer-encoding':
+            return None
+    return 0
+
+
+def _request_path(head: bytes) -> str:
+    parts = head.split(b'\r\n', 1)[0].split()
+    return parts[1].decode('latin-1') if len(parts) == 3 else '/'
+
+
+def _plain_response(status: int, reason: str) -> bytes:
+    body = reason.encode('ascii')
+    return (f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: text/plain\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n").encode('ascii') + body
+
+
+class AsyncHTTPServer:
+    """
+    asyncio front end for a BaseHTTPRequestHandler subclass.
+
+    Connections, keep-alive idling and slow clients are handled by
+    coroutines on a single event loop. Only a fully received request is
+    handed to the thread pool, where the blocking handler code (PBKDF2,
+    mysql.connector, PIL) runs; an idle connection never holds a thread.
+    """
+
+    def __init__(self, address, handler_class, threads=16):
+        self.address  = address
+        # Per-route body limit of the handler, checked before buffering.
+        self._body_limit = getattr(handler_class, 'body_limit',
+                                   lambda path: MAX_BODY_BYTES)
+        self._handler = _buffered(handler_class)
+        self._info    = _ServerInfo(address)
+        self._pool    = ThreadPoolExecutor(max_workers=threads,
+                                           thread_name_prefix='aio-worker')
+        self._server  = None
+        self._idle    = set()
+        self._tasks   = set()
+        self._stopped = None
+        self._loop    = None
+
+    def _dispatch(self, raw, peer):
+        handler = self._handler(raw, peer, self._info)
+        return handler.wfile.getvalue(), handler.close_connection
+
+    async def _serve_client(self, reader, writer):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        peer = writer.get_extra_info('peername') or ('', 0)
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                self._idle.add(writer)
+                try:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b'\r\n\r\n'), IDLE_TIMEOUT)
+                except asyncio.LimitOverrunError:
+                    writer.write(_plain_response(431, 'Request Header Fields Too Large'))
+                    break
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError,
+                        ConnectionError):
+                    break
+                finally:
+                    self._idle.discard(writer)
+
+                length = _content_length(head)
+                if length is None:
+                    writer.write(_plain_response(400, 'Bad Request'))
+                    break
+                limit = min(MAX_BODY_BYTES, self._body_limit(_request_path(head)))
+                if length > limit:
+                    writer.write(_plain_response(413, 'Payload Too Large'))
+                    break
+                try:
+                    body = (await asyncio.wait_for(reader.readexactly(length),
+                                                   FORM_READ_TIMEOUT)
+                            if length else b'')
+                except asyncio.TimeoutError:
+                    writer.write(_plain_response(408, 'Request Timeout'))
+                    break
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                response, close = await loop.run_in_executor(
+                    self._pool, self._dispatch, head + body, peer)
+                writer.write(response)
+                await writer.drain()
+                if close:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._tasks.discard(task)
+            writer.close()
+
+    async def serve(self):
+        self._loop    = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._server = await asyncio.start_server(
+            self._serve_client, self.address[0], self.address[1],
+            limit=MAX_HEADER_BYTES, reuse_address=True)
+
+        loop = self._loop
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                loop.add_signal_handler(sig, self._stopped.set)
+
+        await self._stopped.wait()
+
+        # Stop accepting, hang up on idle keep-alive clients and let
+        # requests already in the pool finish.
+        self._server.close()
+        for writer in list(self._idle):
+            writer.close()
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=30)
+        await self._server.wait_closed()
+        self._pool.shutdown(wait=True)
+
+    def stop(self):
+        """Ask a running server to shut down; safe to call from any thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+
+def serve_async(address, handler_class, threads=16):
+    server = AsyncHTTPServer(address, handler_class, threads=threads)
+    asyncio.run(server.serve())
@@ -1,67 +1,186 @@
 import os
-import hashlib
 import hmac
+import time
 import secrets
 import datetime
 
-from db import get_connection
+import db
+import tokens
+import storage
+from cache import TTLCache
+from metrics import phase
+from hashing import service as _hashing, make_hash, decode_hash, HASH_ALGORITHM
+
+# Cost for new hashes; `python hashing.py --target-ms N` suggests a value
+# for this machine. Hashes made with another cost still verify, and are
+# re-hashed at this cost on the next successful login.
+PBKDF2_ITERATIONS = int(os.getenv('PBKDF2_ITERATIONS', 100_000))
+
+# Per-process cache of session id -> user row. Entries never outlive the
+# session itself, and SESSION_CACHE_TTL bounds how long a change made by
+# another worker process can go unnoticed.
+SESSION_CACHE_SIZE = int(os.getenv('SESSION_CACHE_SIZE', 10_000))
+SESSION_CACHE_TTL  = float(os.getenv('SESSION_CACHE_TTL', 30))
+
+_session_cache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+
+# 'db'    → opaque ids stored in the sessions table (default)
+# 'token' → HMAC-signed tokens carrying user id, expiry and the user's
+#           session_version; verified without touching the sessions table
+SESSION_MODE = os.getenv('SESSION_MODE', 'db')
+
+if SESSION_MODE not in ('db', 'token'):
+    raise RuntimeError(f"Unknown SESSION_MODE: {SESSION_MODE}")
+if SESSION_MODE == 'token' and not tokens.SESSION_KEYS:
+    raise RuntimeError("Set SESSION_KEYS to use SESSION_MODE=token")
+
+# Token mode: user id -> user row, shared by every token of that user.
+_user_cache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
 
 def hash_password(password: str) -> bytes:
+    # Salt generation and PBKDF2 both run on the hashing pool.
+    with phase('hash'):
+        return _hashing.run(make_hash, password, PBKDF2_ITERATIONS)
 
-    salt = os.urandom(16)
-    dk   = hashlib.pbkdf2_hmac(
-        'sha256',                  # Hash algorithm
-        password.encode('utf-8'),  # Convert password to bytes
-        salt,                      # Provide the salt
-        100_000                    # Number of iterations
-    )
-    return salt + dk
+def _split_hash(stored):
+    algorithm, iterations, salt, expected_dk = decode_hash(stored)
+    if algorithm != HASH_ALGORITHM:
+        raise ValueError(f"Unsupported password hash: {algorithm}")
+    return iterations, salt, expected_dk
 
 def check_password(stored: bytes, password: str) -> bool:
     """
-    Verify a plaintext password against the stored (salt||dk).
+    Verify a plaintext password against a stored hash in either the encoded
+    or the legacy salt||dk format, with the cost recorded in the hash.
     Uses hmac.compare_digest for timing-safe comparison.
     """
-    salt        = stored[:16]
-    expected_dk = stored[16:]
-    new_dk      = hashlib.pbkdf2_hmac(
-        'sha256',
-        password.encode('utf-8'),
-        salt,
-        100_000
-    )
+    iterations, salt, expected_dk = _split_hash(stored)
+    with phase('hash'):
+        new_dk = _hashing.derive(
+            password.encode('utf-8'),
+            salt,
+            iterations
+        )
+    return hmac.compare_digest(new_dk, expected_dk)
+
+def needs_rehash(stored: bytes) -> bool:
+    """True when a stored hash is legacy or made with another cost."""
+    stored = stored.encode('ascii') if isinstance(stored, str) else bytes(stored)
+    if not stored.startswith(HASH_ALGORITHM.encode('ascii') + b'$'):
+        return True
+    return _split_hash(stored)[0] != PBKDF2_ITERATIONS
+
+def upgrade_password_hash(user_id: int, stored: bytes, password: str) -> bool:
+    """
+    After a successful login, re-hash the password at the current cost if
+    the stored hash is legacy or uses another iteration count. Best effort:
+    a busy hashing pool or a failed write leaves the old hash in place to be
+    upgraded on a later login. Returns True if the hash was replaced.
+    The write commits on its own, so a failure cannot roll back the
+    session the login goes on to create.
+    """
+    if not needs_rehash(stored):
+        return False
+    try:
+        new_hash = hash_password(password)
+        with db.separate_transaction():
+            storage.update_password_hash(user_id, new_hash)
+    except Exception:
+        return False
+    invalidate_user(user_id)
+    return True
+
+async def hash_password_async(password: str) -> bytes:
+    """Awaitable hash_password; the derivation runs on the hashing pool."""
+    return await _hashing.run_async(make_hash, password, PBKDF2_ITERATIONS)
+
+async def check_password_async(stored: bytes, password: str) -> bool:
+    """Awaitable check_password; the derivation runs on the hashing pool."""
+    iterations, salt, expected_dk = _split_hash(stored)
+    new_dk = await _hashing.derive_async(password.encode('utf-8'), salt,
+                                         iterations)
     return hmac.compare_digest(new_dk, expected_dk)
 
+def _load_user(user_id: int):
+    cached = _user_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    user = storage.get_user(user_id)
+    if user is not None:
+        _user_cache.set(user_id, user)
+    return user
+
 def create_session(user_id: int, days: int = 1) -> str:
+    if SESSION_MODE == 'token':
+        user = _load_user(user_id)
+        if user is None:
+            raise ValueError(f"Unknown user: {user_id}")
+        expires = int(time.time()) + days * 86400
+        return tokens.issue(user_id, expires, user['session_version'])
+
     session_id = secrets.token_hex(32)  # 64-character hex token
     expires    = datetime.datetime.utcnow() + datetime.timedelta(days=days)
 
-    conn = get_connection()
-    cur  = conn.cursor()
-    try:
-        cur.execute(
-            "INSERT INTO sessions (session_id, user_id, expires) "
-            "VALUES (%s, %s, %s)",
-            (session_id, user_id, expires)
-        )
-        conn.commit()
-    finally:
-        cur.close()
-        conn.close()
-
+    storage.create_session(session_id, user_id, expires)
     return session_id
 
+def _get_user_from_token(token: str):
+    claims = tokens.verify(token)
+    if claims is None:
+        return None
+    user = _load_user(claims['user_id'])
+    if user is None or user['session_version'] != claims['version']:
+        return None
+    return dict(user)
+
 def get_user_from_session(session_id: str):
-    conn = get_connection()
-    cur  = conn.cursor(dictionary=True)
-    try:
-        cur.execute(
-            "SELECT u.* FROM sessions s "
-            "JOIN users u ON u.id = s.user_id "
-            "WHERE s.session_id = %s AND s.expires > NOW()",
-            (session_id,)
-        )
-        return cur.fetchone()
-    finally:
-        cur.close()
-        conn.close()
+    if SESSION_MODE == 'token':
+        return _get_user_from_token(session_id)
+
+    cached = _session_cache.get(session_id)
+    if cached is not None:
+        return dict(cached)
+
+    user = storage.get_session_user(session_id)
+    if user is None:
+        return None
+    expires = user.pop('session_expires')
+    remaining = (expires - datetime.datetime.utcnow()).total_seconds()
+    _session_cache.set(session_id, user, ttl=remaining)
+    return dict(user)
+
+def revoke_sessions(user_id: int):
+    """
+    Invalidate every token issued to a user by bumping their key version.
+    Other worker processes notice within SESSION_CACHE_TTL.
+    """
+    storage.bump_session_version(user_id)
+    invalidate_user(user_id)
+
+def end_session(session_id: str):
+    """Log a session out in whichever session mode is active."""
+    invalidate_session(session_id)
+
+    if SESSION_MODE == 'token':
+        claims = tokens.verify(session_id)
+        if claims is not None:
+            revoke_sessions(claims['user_id'])
+        return
+
+    storage.delete_session(session_id)
+
+def invalidate_session(session_id: str):
+    """Forget a cached session, e.g. on logout."""
+    _session_cache.pop(session_id)
+
+def invalidate_user(user_id: int):
+    """Forget every cached session of a user whose row has changed."""
+    _session_cache.pop_where(lambda user: user['id'] == user_id)
+    _user_cache.pop(user_id)
+
+def session_cache_stats():
+    return _session_cache.stats()
+
+def user_cache_stats():
+    return _user_cache.stats()
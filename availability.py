@@ -0,0 +1,170 @@
+# availability.py
+#
+# Bloom filters of every username and email in use, so registration can
+# skip the users-table lookup for names nobody has and turn away an
+# obvious duplicate before the rate limiter and PBKDF2 see it. A filter
+# only ever says "maybe taken" or "free as far as this process knows";
+# "maybe" is confirmed against the users table.
+
+import os
+import math
+import hashlib
+import threading
+
+import storage
+
+AVAILABILITY_CAPACITY         = int(os.getenv('AVAILABILITY_CAPACITY', 1_000_000))
+AVAILABILITY_ERROR_RATE       = float(os.getenv('AVAILABILITY_ERROR_RATE', 0.001))
+AVAILABILITY_REBUILD_INTERVAL = float(os.getenv('AVAILABILITY_REBUILD_INTERVAL', 600))  # 0 = off
+AVAILABILITY_SCAN_BATCH       = int(os.getenv('AVAILABILITY_SCAN_BATCH', 5000))
+
+
+def _normalize(value: str) -> bytes:
+    # Names are ASCII and both schemas compare them case-insensitively;
+    # folding here can only add false positives, which the query sorts out.
+    return value.lower().encode('utf-8')
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter sized for `capacity` items at `error_rate`.
+    The k bit positions come from one BLAKE2b digest by double hashing.
+    """
+
+    def __init__(self, capacity=AVAILABILITY_CAPACITY,
+                 error_rate=AVAILABILITY_ERROR_RATE):
+        capacity    = max(capacity, 1)
+        self.bits   = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.count  = 0
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, item: bytes):
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, item: bytes):
+        for pos in self._positions(item):
+            self._array[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: bytes) -> bool:
+        return all(self._array[pos >> 3] & (1 << (pos & 7))
+                   for pos in self._positions(item))
+
+
+class AvailabilityIndex:
+    """
+    Username and email filters for this process. Until the first build()
+    finishes every lookup goes to the database. Names registered through
+    other worker processes are missed until the next rebuild, so a miss
+    here is only ever a missed shortcut: the UNIQUE constraint still has
+    the last word.
+    """
+
+    def __init__(self, capacity=AVAILABILITY_CAPACITY,
+                 error_rate=AVAILABILITY_ERROR_RATE):
+        self.capacity   = capacity
+        self.error_rate = error_rate
+        self._lock      = threading.Lock()
+        self._filters   = None   # {'username': BloomFilter, 'email': BloomFilter}
+        self._pending   = None   # names added while a build() is scanning
+        self._counters  = dict.fromkeys(
+            ('builds', 'filtered', 'confirmed', 'false_positives'), 0)
+
+    def _new_filters(self, expected):
+        # Leave room to grow until the next rebuild resizes the filters.
+        capacity = max(self.capacity, expected * 2)
+        return {'username': BloomFilter(capacity, self.error_rate),
+                'email':    BloomFilter(capacity, self.error_rate)}
+
+    @property
+    def ready(self) -> bool:
+        return self._filters is not None
+
+    def build(self, batch_size=AVAILABILITY_SCAN_BATCH) -> int:
+        """
+        Rebuild both filters from a streaming scan of the users table and
+        swap them in. Returns the number of users indexed.
+        """
+        previous = self._filters
+        filters  = self._new_filters(previous['email'].count if previous else 0)
+        pending  = []
+        with self._lock:
+            self._pending = pending
+
+        total = 0
+        try:
+            for username, email in storage.iter_identities(batch_size):
+                filters['username'].add(_normalize(username))
+                filters['email'].add(_normalize(email))
+                total += 1
+        finally:
+            with self._lock:
+                self._pending = None
+        with self._lock:
+            for kind, value in pending:
+                filters[kind].add(value)
+            self._filters = filters
+            self._counters['builds'] += 1
+        return total
+
+    def add(self, username=None, email=None):
+        """Record a name just registered or renamed to."""
+        with self._lock:
+            for kind, value in (('username', username), ('email', email)):
+                if not value:
+                    continue
+                item = _normalize(value)
+                if self._filters is not None:
+                    self._filters[kind].add(item)
+                if self._pending is not None:
+                    self._pending.append((kind, item))
+
+    def taken(self, kind: str, value: str, exact=False) -> bool:
+        """
+        Whether a username or email is in use. A filter miss answers "free"
+        without a query unless `exact`: the filters miss names registered
+        through other worker processes since the last rebuild.
+        """
+        filters = None if exact else self._filters
+        if filters is not None and _normalize(value) not in filters[kind]:
+            with self._lock:
+                self._counters['filtered'] += 1
+            return False
+
+        exists = (storage.username_taken(value) if kind == 'username'
+                  else storage.email_taken(value))
+        with self._lock:
+            self._counters['confirmed'] += 1
+            if filters is not None and not exists:
+                self._counters['false_positives'] += 1
+        return exists
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['indexed'] = self._filters['email'].count if self._filters else 0
+        return stats
+
+
+index = AvailabilityIndex()
+
+
+def _run_forever(interval, stop):
+    while not stop.wait(interval):
+        try:
+            index.build()
+        except Exception as err:
+            print(f"Availability rebuild error: {err}")
+
+
+def start_rebuilder(interval=AVAILABILITY_REBUILD_INTERVAL):
+    """Rebuild the filters every `interval` seconds on a daemon thread."""
+    stop   = threading.Event()
+    thread = threading.Thread(target=_run_forever, name='availability-rebuild',
+                              args=(interval, stop), daemon=True)
+    thread.start()
+    return stop
@@ -0,0 +1,116 @@
+# backends.py
+
+import os
+import sqlite3
+import datetime
+
+SQL_DIR = os.path.join(os.path.dirname(__file__), 'sql')
+
+
+class Backend:
+    """
+    One database engine: how to open and health-check a connection and how
+    to turn the MySQL-dialect statements of storage.py into its own dialect.
+    Translated statements are cached, so each is rewritten once per process.
+    """
+    name = None
+    integrity_errors = ()
+
+    def __init__(self):
+        self._statements = {}
+
+    def connect(self):
+        raise NotImplementedError
+
+    def ping(self, conn):
+        raise NotImplementedError
+
+    def _translate(self, sql: str) -> str:
+        return sql
+
+    def sql(self, sql: str) -> str:
+        stmt = self._statements.get(sql)
+        if stmt is None:
+            stmt = self._statements[sql] = self._translate(sql)
+        return stmt
+
+
+class MySQLBackend(Backend):
+    name = 'mysql'
+
+    def __init__(self, host, port, user, password, database):
+        super().__init__()
+        if not all((user, password, database)):
+            raise RuntimeError("Set DB_USER, DB_PASSWORD, and DB_NAME")
+        import mysql.connector
+        self._mysql   = mysql.connector
+        self._params  = dict(host=host, port=port, user=user,
+                             password=password, database=database)
+        self.integrity_errors = (mysql.connector.IntegrityError,)
+
+    def connect(self):
+        try:
+            return self._mysql.connect(
+                charset    = 'utf8mb4',
+                autocommit = False,
+                **self._params
+            )
+        except self._mysql.Error as err:
+            print(f"DB connection error: {err}")
+            raise
+
+    def ping(self, conn):
+        conn.ping(reconnect=False)
+
+
+def _adapt_datetime(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+def _convert_datetime(raw):
+    return datetime.datetime.fromisoformat(raw.decode('ascii'))
+
+# Store DATETIME columns as 'YYYY-MM-DD HH:MM:SS' (what datetime('now') and
+# CURRENT_TIMESTAMP produce, so plain string comparison orders them) and
+# read them back as datetime objects, as mysql.connector does.
+sqlite3.register_adapter(datetime.datetime, _adapt_datetime)
+sqlite3.register_converter('DATETIME', _convert_datetime)
+
+
+class SQLiteBackend(Backend):
+    """
+    Embedded SQLite database in WAL mode for single-node deployments,
+    benchmarks and tests. The schema in sql/init_db.sqlite.sql is applied
+    on the first connection.
+    """
+    name = 'sqlite'
+    integrity_errors = (sqlite3.IntegrityError,)
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._schema_ready = False
+
+    def connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout           = 10,
+            detect_types      = sqlite3.PARSE_DECLTYPES,
+            check_same_thread = False,   # pooled connections change threads
+            cached_statements = 256
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        if not self._schema_ready:
+            with open(os.path.join(SQL_DIR, 'init_db.sqlite.sql'), 'r',
+                      encoding='utf-8') as f:
+                conn.executescript(f.read())
+            self._schema_ready = True
+        return conn
+
+    def ping(self, conn):
+        conn.execute('SELECT 1').fetchone()
+
+    def _translate(self, sql: str) -> str:
+        return sql.replace('%s', '?').replace('NOW()', "datetime('now')")
+
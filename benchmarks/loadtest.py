@@ -0,0 +1,295 @@
+# benchmarks/loadtest.py
+#
+# Boots server.py against the configured database and drives a mixed
+# register/login/browse workload, reporting per-route throughput and
+# latency percentiles as JSON.
+#
+#   DB_USER=... DB_PASSWORD=... DB_NAME=... \
+#       python benchmarks/loadtest.py --concurrency 32 --duration 30
+#
+# or, without a database server:
+#
+#   DB_BACKEND=sqlite python benchmarks/loadtest.py
+#
+# CAPTCHAs are solved by reading the server's SQLite CAPTCHA store, which
+# the harness points at a private file; no bypass exists in the server.
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from captcha_store import SQLiteCaptchaStore  # noqa: E402
+
+PASSWORD = 'Bench!Pass1'
+DEFAULT_MIX = 'login_page=30,login=10,browse=50,register=10'
+
+_CAPTCHA_ID = re.compile(r'name="captcha_id" value="([^"]+)"')
+
+
+class Client:
+    """One persistent HTTP connection plus the session cookie of one user."""
+
+    def __init__(self, host, port, recorder):
+        self.conn     = http.client.HTTPConnection(host, port, timeout=30)
+        self.recorder = recorder
+        self.cookie   = None
+
+    def request(self, label, method, path, form=None):
+        headers = {}
+        body = None
+        if form is not None:
+            body = urllib.parse.urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+
+        started = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            resp = self.conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.recorder.record(label, time.perf_counter() - started, error=True)
+            return None, b''
+        self.recorder.record(label, time.perf_counter() - started,
+                             error=resp.status >= 500)
+        if resp.getheader('Connection', '').lower() == 'close':
+            self.conn.close()
+        return resp, data
+
+
+class Recorder:
+    def __init__(self):
+        self._lock      = threading.Lock()
+        self.latencies  = {}
+        self.errors     = {}
+
+    def record(self, label, seconds, error=False):
+        with self._lock:
+            self.latencies.setdefault(label, []).append(seconds)
+            if error:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1,
+                       int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Workload:
+    def __init__(self, host, port, captcha_store, run_id):
+        self.host, self.port = host, port
+        self.store   = captcha_store
+        self.run_id  = run_id
+        self._seq    = 0
+        self._lock   = threading.Lock()
+        self.users   = []
+
+    def _next_user(self):
+        with self._lock:
+            self._seq += 1
+            n = self._seq
+        return f'bench_{self.run_id}_{n}', f'bench-{self.run_id}-{n}@example.com'
+
+    def register(self, client):
+        _, page = client.request('GET /register', 'GET', '/register')
+        m = _CAPTCHA_ID.search(page.decode('utf-8', 'ignore'))
+        if not m:
+            return None
+        captcha_id = m.group(1)
+        code = self.store.get(captcha_id) or ''
+        username, email = self._next_user()
+        resp, _ = client.request('POST /register', 'POST', '/register', {
+            'username': username, 'email': email, 'password': PASSWORD,
+            'captcha_id': captcha_id, 'captcha_code': code
+        })
+        if resp is not None and resp.status == 302:
+            with self._lock:
+                self.users.append(email)
+            return email
+        return None
+
+    def login(self, client, email=None):
+        email = email or random.choice(self.users)
+        resp, _ = client.request('POST /login', 'POST', '/login',
+                                 {'email': email, 'password': PASSWORD})
+        if resp is not None and resp.status == 302:
+            cookie = resp.getheader('Set-Cookie') or ''
+            client.cookie = cookie.split(';', 1)[0]
+
+    def login_page(self, client):
+        client.request('GET /login', 'GET', '/login')
+
+    def browse(self, client):
+        if not client.cookie:
+            return self.login(client)
+        path = random.choice(('/profile', '/account', '/'))
+        client.request(f'GET {path}', 'GET', path)
+
+
+def run_workers(workload, recorder, mix, concurrency, duration):
+    actions = list(mix)
+    weights = [mix[a] for a in actions]
+    stop_at = time.monotonic() + duration
+
+    def worker():
+        client = Client(workload.host, workload.port, recorder)
+        while time.monotonic() < stop_at:
+            action = random.choices(actions, weights)[0]
+            getattr(workload, action)(client)
+        client.conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.monotonic() - started
+
+
+def summarize(recorder, elapsed):
+    routes = {}
+    total = 0
+    for label, values in sorted(recorder.latencies.items()):
+        values.sort()
+        total += len(values)
+        routes[label] = {
+            'count':  len(values),
+            'errors': recorder.errors.get(label, 0),
+            'rps':    round(len(values) / elapsed, 2),
+            'mean_ms': round(sum(values) / len(values) * 1000, 3),
+            'p50_ms': round(percentile(values, 50) * 1000, 3),
+            'p95_ms': round(percentile(values, 95) * 1000, 3),
+            'p99_ms': round(percentile(values, 99) * 1000, 3),
+            'max_ms': round(values[-1] * 1000, 3),
+        }
+    return {'elapsed_s': round(elapsed, 3), 'requests': total,
+            'rps': round(total / elapsed, 2), 'routes': routes}
+
+
+def compare(result, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    for label, stats in result['routes'].items():
+        before = baseline.get('routes', {}).get(label)
+        if not before or not before['p95_ms']:
+            continue
+        change = (stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+        print(f"{label:20} p95 {before['p95_ms']:9.2f} -> "
+              f"{stats['p95_ms']:9.2f} ms ({change:+.1f}%)")
+
+
+def start_server(port, captcha_path, server_args):
+    # Every simulated user shares one IP: the login rate limits stay off.
+    env = dict(os.environ, PORT=str(port), CAPTCHA_STORE='sqlite',
+               CAPTCHA_STORE_PATH=captcha_path, RATE_IP_PER_MINUTE='0',
+               RATE_EMAIL_PER_MINUTE='0')
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, 'server.py'),
+                             *server_args],
+                            cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/login')
+            conn.getresponse().read()
+            conn.close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError('Server did not start')
+
+
+def cleanup(run_id):
+    import storage
+    storage.delete_users_like(f'bench-{run_id}-%@example.com')
+
+
+def parse_mix(spec):
+    mix = {}
+    for item in spec.split(','):
+        name, _, weight = item.partition('=')
+        if name not in ('login_page', 'login', 'browse', 'register'):
+            raise SystemExit(f'Unknown workload: {name}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test the registration app')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20, help='seconds')
+    parser.add_argument('--users', type=int, default=20,
+                        help='accounts registered before the run')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help=f'weighted workloads (default: {DEFAULT_MIX})')
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--compare', help='earlier JSON result to diff p95 against')
+    parser.add_argument('--keep-users', action='store_true')
+    parser.add_argument('server_args', nargs=argparse.REMAINDER,
+                        help='extra arguments for server.py after "--"')
+    args = parser.parse_args(argv)
+    server_args = [a for a in args.server_args if a != '--']
+
+    run_id = f'{int(time.time())}{random.randrange(1000):03d}'
+    captcha_path = os.path.join(tempfile.mkdtemp(prefix='loadtest-'), 'captcha.db')
+    proc = start_server(args.port, captcha_path, server_args)
+    try:
+        store    = SQLiteCaptchaStore(path=captcha_path)
+        workload = Workload('127.0.0.1', args.port, store, run_id)
+
+        mix  = parse_mix(args.mix)
+        seed = Client('127.0.0.1', args.port, Recorder())
+        for _ in range(args.users):
+            workload.register(seed)
+        if not workload.users and {'login', 'browse'} & mix.keys():
+            raise SystemExit('Could not register any benchmark users')
+
+        recorder = Recorder()
+        elapsed  = run_workers(workload, recorder, mix,
+                               args.concurrency, args.duration)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    result = summarize(recorder, elapsed)
+    result['config'] = {
+        'concurrency': args.concurrency, 'duration_s': args.duration,
+        'mix': args.mix, 'server_args': server_args
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+
+    for label, stats in result['routes'].items():
+        print(f"{label:20} {stats['count']:7d} req {stats['rps']:8.1f}/s  "
+              f"p50 {stats['p50_ms']:8.2f}  p95 {stats['p95_ms']:8.2f}  "
+              f"p99 {stats['p99_ms']:8.2f} ms  errors {stats['errors']}")
+    print(f"Wrote {args.output}")
+    if args.compare:
+        compare(result, args.compare)
+    if not args.keep_users:
+        cleanup(run_id)
+
+
+if __name__ == '__main__':
+    main()
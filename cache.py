@@ -0,0 +1,78 @@
+# cache.py
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after a TTL.
+    Each entry may carry its own, shorter, TTL.
+    """
+
+    def __init__(self, maxsize=1024, ttl=30.0):
+        self.maxsize = maxsize
+        self.ttl     = ttl
+        self._data   = OrderedDict()   # key -> (expires_at, value)
+        self._lock   = threading.Lock()
+        self._counters = dict.fromkeys(
+            ('hits', 'misses', 'evictions', 'expirations', 'invalidations'), 0)
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._counters['misses'] += 1
+                return default
+            if entry[0] <= now:
+                del self._data[key]
+                self._counters['expirations'] += 1
+                self._counters['misses'] += 1
+                return default
+            self._data.move_to_end(key)
+            self._counters['hits'] += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self._counters['invalidations'] += 1
+            return entry[1] if entry else None
+
+    def pop_where(self, predicate):
+        """Drop every entry whose value matches predicate; returns the count."""
+        with self._lock:
+            keys = [k for k, (_, v) in self._data.items() if predicate(v)]
+            for k in keys:
+                del self._data[k]
+            self._counters['invalidations'] += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = len(self._data)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
@@ -1,30 +1,154 @@
+import os
+import time
 import random
 import string
 import uuid
+import threading
+from collections import deque
 from PIL import Image, ImageDraw, ImageFont
 import io
 
-_CAPTCHA_STORE = {}
+from captcha_store import make_store
+from metrics import phase
 
-def generate_captcha():
+# Ready-made challenges kept in memory; 0 generates every CAPTCHA inline.
+CAPTCHA_POOL_DEPTH  = int(os.getenv('CAPTCHA_POOL_DEPTH', 32))
+# The producer wakes up once the pool drops to this many entries.
+CAPTCHA_POOL_REFILL = int(os.getenv('CAPTCHA_POOL_REFILL', 8))
+# Seconds the producer pauses after a challenge fails to render.
+CAPTCHA_POOL_RETRY  = float(os.getenv('CAPTCHA_POOL_RETRY', 1))
+
+# Expected code and PNG by captcha id; see captcha_store for the backends.
+_CAPTCHA_STORE = make_store()
+
+_font      = None
+_font_lock = threading.Lock()
+
+def _get_font():
+    global _font
+    if _font is None:
+        with _font_lock:
+            if _font is None:
+                _font = ImageFont.load_default()
+    return _font
+
+def _new_challenge():
+    """Return a fresh (captcha_id, code, png_bytes) triple."""
     code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=5))
     captcha_id = str(uuid.uuid4())
 
     img = Image.new('RGB', (120, 30), color=(255, 255, 255))
     draw = ImageDraw.Draw(img)
-    font = ImageFont.load_default()
-    draw.text((5, 5), code, font=font, fill=(0, 0, 0))
+    draw.text((5, 5), code, font=_get_font(), fill=(0, 0, 0))
 
     buf = io.BytesIO()
     img.save(buf, format='PNG')
-    image_bytes = buf.getvalue()
+    return captcha_id, code, buf.getvalue()
+
+
+class CaptchaPool:
+    """
+    Ring buffer of pre-rendered challenges filled by a background thread.
+    The producer sleeps until the buffer drops to `refill` entries and then
+    tops it up to `depth`; pop() never blocks and returns None when empty.
+    A factory error is counted and retried after `retry_delay` seconds.
+    """
+
+    def __init__(self, depth, refill, factory=_new_challenge,
+                 retry_delay=CAPTCHA_POOL_RETRY):
+        self.depth       = depth
+        self.refill      = min(refill, depth)
+        self.factory     = factory
+        self.retry_delay = retry_delay
+        self._reset()
+
+    def _reset(self):
+        self._buffer  = deque(maxlen=self.depth)
+        self._cond    = threading.Condition()
+        self._thread  = None
+        self._counters = dict.fromkeys(
+            ('produced', 'hits', 'underflows', 'fills', 'errors'), 0)
+
+    def _start(self):
+        # Caller holds the condition lock.
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name='captcha-pool')
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while len(self._buffer) > self.refill:
+                    self._cond.wait()
+                missing = self.depth - len(self._buffer)
+                self._counters['fills'] += 1
+            for _ in range(missing):
+                try:
+                    item = self.factory()
+                except Exception as err:
+                    print(f"CAPTCHA pool error: {err}")
+                    with self._cond:
+                        self._counters['errors'] += 1
+                    time.sleep(self.retry_delay)
+                    break
+                with self._cond:
+                    self._buffer.append(item)
+                    self._counters['produced'] += 1
 
-    _CAPTCHA_STORE[captcha_id] = code
+    def pop(self):
+        with self._cond:
+            self._start()
+            if not self._buffer:
+                self._counters['underflows'] += 1
+                self._cond.notify()
+                return None
+            item = self._buffer.popleft()
+            self._counters['hits'] += 1
+            if len(self._buffer) <= self.refill:
+                self._cond.notify()
+            return item
+
+    def reset_after_fork(self):
+        # The producer thread does not survive fork(); start a new one lazily.
+        self._reset()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._counters)
+            stats['available'] = len(self._buffer)
+            stats['depth']     = self.depth
+        return stats
+
+
+_pool = CaptchaPool(CAPTCHA_POOL_DEPTH, CAPTCHA_POOL_REFILL)
+os.register_at_fork(after_in_child=_pool.reset_after_fork)
+
+def share_store():
+    """Switch to a store every worker process sees; call before forking."""
+    global _CAPTCHA_STORE
+    _CAPTCHA_STORE = make_store(shared=True)
+
+def generate_captcha():
+    item = _pool.pop() if CAPTCHA_POOL_DEPTH > 0 else None
+    if item is None:
+        with phase('captcha'):
+            item = _new_challenge()
+    captcha_id, code, image_bytes = item
+
+    _CAPTCHA_STORE.put(captcha_id, code, image_bytes)
     return captcha_id, image_bytes
 
+def get_captcha_image(captcha_id: str):
+    """PNG bytes of a pending challenge, or None if unknown or expired."""
+    return _CAPTCHA_STORE.get_image(captcha_id)
+
+def captcha_pool_stats():
+    return _pool.stats()
+
 def verify_captcha(captcha_id: str, user_input: str) -> bool:
-    expected = _CAPTCHA_STORE.get(captcha_id)
-    if expected and expected.lower() == user_input.strip().lower():
-        del _CAPTCHA_STORE[captcha_id]
-        return True
-    return False
+    answer = user_input.strip()
+    if not captcha_id or not answer:
+        return False
+    # Single use: a correct answer removes the entry in the same step.
+    return _CAPTCHA_STORE.consume(captcha_id, answer)
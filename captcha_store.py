@@ -0,0 +1,187 @@
+# captcha_store.py
+
+import os
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+
+from sqlite_local import LocalConnections
+
+# auto = memory for a single process, sqlite when prefork workers share it
+CAPTCHA_STORE       = os.getenv('CAPTCHA_STORE', 'auto')     # auto | memory | sqlite
+CAPTCHA_STORE_PATH  = os.getenv(
+    'CAPTCHA_STORE_PATH',
+    os.path.join(tempfile.gettempdir(), 'registration_app_captcha.db'))
+CAPTCHA_TTL         = float(os.getenv('CAPTCHA_TTL', 300))
+CAPTCHA_MAX_ENTRIES = int(os.getenv('CAPTCHA_MAX_ENTRIES', 10_000))
+
+
+class MemoryCaptchaStore:
+    """
+    Per-process store with TTL expiry and a hard entry cap.
+
+    Every entry gets the same TTL, so insertion order is also expiry order:
+    expired entries are always at the front of the OrderedDict and each
+    put() only pops from there, which keeps cleanup O(1) amortised.
+    """
+
+    def __init__(self, ttl=CAPTCHA_TTL, max_entries=CAPTCHA_MAX_ENTRIES):
+        if max_entries < 1:
+            raise ValueError("CAPTCHA max_entries must be at least 1")
+        self.ttl         = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()   # id -> (expires, code, png)
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(('expired', 'evicted', 'verified'), 0)
+
+    def _purge(self, now):
+        # Caller holds the lock.
+        while self._data:
+            key, entry = next(iter(self._data.items()))
+            if entry[0] > now:
+                break
+            del self._data[key]
+            self._counters['expired'] += 1
+        while len(self._data) >= self.max_entries:
+            self._data.popitem(last=False)
+            self._counters['evicted'] += 1
+
+    def put(self, captcha_id, code, png=b''):
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            self._data[captcha_id] = (now + self.ttl, code, png)
+
+    def _live(self, captcha_id):
+        with self._lock:
+            entry = self._data.get(captcha_id)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry
+
+    def get(self, captcha_id):
+        """Return the expected code without consuming it."""
+        entry = self._live(captcha_id)
+        return entry[1] if entry else None
+
+    def get_image(self, captcha_id):
+        entry = self._live(captcha_id)
+        return entry[2] if entry else None
+
+    def consume(self, captcha_id, answer) -> bool:
+        """Atomically check an answer and delete the entry if it matches."""
+        with self._lock:
+            entry = self._data.get(captcha_id)
+            if (entry is None or entry[0] <= time.monotonic()
+                    or entry[1].lower() != answer.lower()):
+                return False
+            del self._data[captcha_id]
+            self._counters['verified'] += 1
+            return True
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._data)
+        return stats
+
+
+class SQLiteCaptchaStore:
+    """
+    Store shared by every worker process on a host through one SQLite file
+    in WAL mode. `seq` grows with each insert, so the entry cap is enforced
+    by deleting everything older than the newest max_entries rows, and
+    expiry removes a small batch through the expires index per put().
+    """
+
+    _PURGE_BATCH = 64
+
+    def __init__(self, path=CAPTCHA_STORE_PATH, ttl=CAPTCHA_TTL,
+                 max_entries=CAPTCHA_MAX_ENTRIES):
+        if max_entries < 1:
+            raise ValueError("CAPTCHA max_entries must be at least 1")
+        self.path        = path
+        self.ttl         = ttl
+        self.max_entries = max_entries
+        self._conns      = LocalConnections(path)
+        conn = self._conn()
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(captchas)")]
+        if columns and 'png' not in columns:
+            # Short-lived data from an older layout: just start over.
+            conn.execute("DROP TABLE captchas")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS captchas (
+                seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+                id      TEXT    NOT NULL UNIQUE,
+                code    TEXT    NOT NULL,
+                png     BLOB    NOT NULL,
+                expires REAL    NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_captchas_expires ON captchas (expires);
+        """)
+
+    def _conn(self):
+        return self._conns.get()
+
+    def put(self, captcha_id, code, png=b''):
+        now  = time.time()
+        conn = self._conn()
+        cur  = conn.execute(
+            "INSERT OR REPLACE INTO captchas (id, code, png, expires) "
+            "VALUES (?, ?, ?, ?)",
+            (captcha_id, code, png, now + self.ttl))
+        conn.execute(
+            "DELETE FROM captchas WHERE seq IN "
+            "(SELECT seq FROM captchas WHERE expires <= ? LIMIT ?)",
+            (now, self._PURGE_BATCH))
+        conn.execute("DELETE FROM captchas WHERE seq <= ?",
+                     (cur.lastrowid - self.max_entries,))
+
+    def get(self, captcha_id):
+        """Return the expected code without consuming it."""
+        row = self._conn().execute(
+            "SELECT code FROM captchas WHERE id = ? AND expires > ?",
+            (captcha_id, time.time())).fetchone()
+        return row[0] if row else None
+
+    def get_image(self, captcha_id):
+        row = self._conn().execute(
+            "SELECT png FROM captchas WHERE id = ? AND expires > ?",
+            (captcha_id, time.time())).fetchone()
+        return bytes(row[0]) if row else None
+
+    def consume(self, captcha_id, answer) -> bool:
+        """Atomically check an answer and delete the entry if it matches."""
+        cur = self._conn().execute(
+            "DELETE FROM captchas WHERE id = ? AND code = ? COLLATE NOCASE "
+            "AND expires > ?",
+            (captcha_id, answer, time.time()))
+        return cur.rowcount == 1
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM captchas").fetchone()[0]
+
+    def stats(self):
+        return {'entries': len(self)}
+
+
+def make_store(shared=False, kind=None):
+    """
+    Build the configured store. With shared=True the store must be visible
+    to every worker process, which rules out the memory store.
+    """
+    kind = kind or CAPTCHA_STORE
+    if kind == 'auto':
+        kind = 'sqlite' if shared else 'memory'
+    if kind == 'sqlite':
+        return SQLiteCaptchaStore()
+    if kind == 'memory':
+        if shared:
+            raise RuntimeError("CAPTCHA_STORE=memory is per process; "
+                               "use sqlite with several worker processes")
+        return MemoryCaptchaStore()
+    raise RuntimeError(f"Unknown CAPTCHA_STORE: {kind}")
@@ -0,0 +1,136 @@
+# compress.py
+#
+# Content-Encoding negotiation for dynamic responses. gzip is always
+# available; brotli and zstd are used when their packages are installed.
+
+import os
+import gzip
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESS_MIN_SIZE      = int(os.getenv('COMPRESS_MIN_SIZE', 512))   # bytes
+COMPRESS_GZIP_LEVEL    = int(os.getenv('COMPRESS_GZIP_LEVEL', 6))
+COMPRESS_CACHE_ENTRIES = int(os.getenv('COMPRESS_CACHE_ENTRIES', 256))
+
+_COMPRESSIBLE = ('text/', 'application/json', 'application/javascript',
+                 'image/svg+xml')
+
+
+def _gzip(body):
+    # mtime=0 keeps the output identical for identical input.
+    return gzip.compress(body, COMPRESS_GZIP_LEVEL, mtime=0)
+
+def _brotli(body):
+    return brotli.compress(body, quality=5)
+
+def _zstd(body):
+    # Compressor objects are not thread-safe; they are cheap to create.
+    return zstandard.ZstdCompressor(level=3).compress(body)
+
+# Server preference, best ratio first; only installed codecs are offered.
+CODECS = OrderedDict(
+    (name, fn) for name, fn, available in (
+        ('br',   _brotli, brotli is not None),
+        ('zstd', _zstd,   zstandard is not None),
+        ('gzip', _gzip,   True),
+    ) if available
+)
+
+
+def compressible(content_type: str) -> bool:
+    return content_type.startswith(_COMPRESSIBLE)
+
+
+def negotiate(accept_encoding: str):
+    """
+    Pick a coding from an Accept-Encoding header, or None for identity.
+    Among the codings the client accepts (q > 0, directly or through "*"),
+    the one with the highest q wins and server preference breaks ties.
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            weights[name] = q
+
+    best, best_q = None, 0.0
+    for name in CODECS:
+        q = weights.get(name, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class CompressedCache:
+    """LRU of compressed bodies keyed by (coding, uncompressed bytes)."""
+
+    def __init__(self, max_entries=COMPRESS_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(('hits', 'misses'), 0)
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self._counters['misses'] += 1
+                return None
+            self._data.move_to_end(key)
+            self._counters['hits'] += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._data)
+        return stats
+
+
+_cache = CompressedCache()
+
+
+def compress(body: bytes, coding: str, cacheable=False) -> bytes:
+    """
+    Encode body with `coding`. cacheable=True marks a body that repeats
+    byte for byte across requests; its encoded form is kept and reused.
+    """
+    if not cacheable:
+        return CODECS[coding](body)
+    key = (coding, body)
+    encoded = _cache.get(key)
+    if encoded is None:
+        encoded = CODECS[coding](body)
+        _cache.set(key, encoded)
+    return encoded
+
+
+def cache_stats():
+    return _cache.stats()
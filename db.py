@@ -1,6 +1,16 @@
 import os
-import mysql.connector
-from mysql.connector import Error
+import time
+import threading
+import contextlib
+import contextvars
+import collections
+
+from metrics import phase
+from backends import MySQLBackend, SQLiteBackend
+
+DB_BACKEND  = os.getenv('DB_BACKEND', 'mysql')      # mysql | sqlite
+SQLITE_PATH = os.getenv('SQLITE_PATH', os.path.join(os.path.dirname(__file__),
+                                                    'registration_app.db'))
 
 DB_HOST     = os.getenv('DB_HOST', 'localhost')
 DB_PORT     = int(os.getenv('DB_PORT', 3306))
@@ -8,20 +18,373 @@ DB_USER     = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
 DB_NAME     = os.getenv('DB_NAME')
 
-if not all((DB_USER, DB_PASSWORD, DB_NAME)):
-    raise RuntimeError("Set DB_USER, DB_PASSWORD, and DB_NAME")
+# Pool tuning (seconds unless noted)
+DB_POOL_SIZE         = int(os.getenv('DB_POOL_SIZE', 10))      # max open connections
+DB_POOL_TIMEOUT      = float(os.getenv('DB_POOL_TIMEOUT', 5))  # wait for a free slot
+DB_POOL_PING_AFTER   = float(os.getenv('DB_POOL_PING_AFTER', 30))
+DB_POOL_IDLE_TIMEOUT = float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300))
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', 3600))
+
+if DB_BACKEND == 'sqlite':
+    backend = SQLiteBackend(SQLITE_PATH)
+elif DB_BACKEND == 'mysql':
+    backend = MySQLBackend(DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME)
+else:
+    raise RuntimeError(f"Unknown DB_BACKEND: {DB_BACKEND}")
+
+
+class PoolError(RuntimeError):
+    """No pooled connection became available in time, or one was misused."""
+
+
+class PooledConnection:
+    """
+    Thin proxy around a pooled connection. close() hands the connection back
+    to the pool instead of closing the socket; everything else is delegated.
+    """
+
+    def __init__(self, pool, raw, created):
+        self._pool    = pool
+        self._raw     = raw
+        self._created = created
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise PoolError("Connection already returned to the pool")
+        return getattr(self._raw, name)
+
+    def close(self):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw, self._created)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of DB connections.
+
+    Idle connections are reused most-recently-used first, so the oldest ones
+    drift to the far end of the idle queue and are evicted once they sit
+    longer than idle_timeout. A connection is pinged before reuse if it has
+    been idle for more than ping_after, and recycled after max_lifetime.
+    """
+
+    def __init__(self, connect, max_size=10, timeout=5.0, ping_after=30.0,
+                 idle_timeout=300.0, max_lifetime=3600.0, ping=None):
+        self._connect     = connect
+        self._ping_raw    = ping or (lambda raw: raw.ping(reconnect=False))
+        self.max_size     = max_size
+        self.timeout      = timeout
+        self.ping_after   = ping_after
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+
+        self._cond    = threading.Condition()
+        self._idle    = collections.deque()   # (raw, created, last_used)
+        self._size    = 0                     # idle + in use
+        self._orphans = []
+        self._counters = dict.fromkeys(
+            ('acquires', 'waits', 'timeouts', 'creates', 'evictions',
+             'ping_failures'), 0)
+
+    def _discard(self, raw):
+        # Caller holds the lock.
+        self._size -= 1
+        self._counters['evictions'] += 1
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _evict_idle(self, now):
+        # Caller holds the lock. Oldest idle entries sit at the left end.
+        while self._idle and now - self._idle[0][2] > self.idle_timeout:
+            raw, _, _ = self._idle.popleft()
+            self._discard(raw)
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        waited   = False
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                self._evict_idle(now)
+                entry = None
+                while self._idle:
+                    raw, created, last_used = self._idle.pop()
+                    if now - created > self.max_lifetime:
+                        self._discard(raw)
+                        continue
+                    entry = (raw, created, last_used)
+                    break
+
+                if entry is None:
+                    if self._size < self.max_size:
+                        self._size += 1
+                    else:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            self._counters['timeouts'] += 1
+                            raise PoolError(
+                                f"No connection available within {self.timeout}s")
+                        if not waited:
+                            self._counters['waits'] += 1
+                            waited = True
+                        self._cond.wait(remaining)
+                        continue
+                self._counters['acquires'] += 1
+
+            if entry is None:
+                return self._create()
+
+            raw, created, last_used = entry
+            if time.monotonic() - last_used > self.ping_after and not self._ping(raw):
+                with self._cond:
+                    self._counters['ping_failures'] += 1
+                    self._discard(raw)
+                    self._size += 1
+                return self._create()
+            return PooledConnection(self, raw, created)
+
+    def _create(self):
+        # A slot has already been reserved in _size.
+        try:
+            raw = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._counters['creates'] += 1
+        return PooledConnection(self, raw, time.monotonic())
+
+    def _ping(self, raw):
+        try:
+            self._ping_raw(raw)
+            return True
+        except Exception:
+            return False
+
+    def release(self, raw, created):
+        # Never hand out a connection with a half-finished transaction.
+        try:
+            if getattr(raw, 'in_transaction', False):
+                raw.rollback()
+            healthy = True
+        except Exception:
+            healthy = False
+
+        with self._cond:
+            if healthy:
+                self._idle.append((raw, created, time.monotonic()))
+            else:
+                self._discard(raw)
+            self._cond.notify()
+
+    def reset_after_fork(self):
+        """
+        Drop connections inherited from the parent process. They are kept
+        referenced but never closed: closing would send COM_QUIT over a
+        socket the parent is still using.
+        """
+        self._cond = threading.Condition()
+        self._orphans.extend(raw for raw, _, _ in self._idle)
+        self._idle.clear()
+        self._size = 0
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._counters)
+            stats['size']    = self._size
+            stats['idle']    = len(self._idle)
+            stats['in_use']  = self._size - len(self._idle)
+            stats['max_size'] = self.max_size
+        return stats
+
+
+_pool = ConnectionPool(
+    backend.connect,
+    max_size     = DB_POOL_SIZE,
+    timeout      = DB_POOL_TIMEOUT,
+    ping_after   = DB_POOL_PING_AFTER,
+    idle_timeout = DB_POOL_IDLE_TIMEOUT,
+    max_lifetime = DB_POOL_MAX_LIFETIME,
+    ping         = backend.ping
+)
+os.register_at_fork(after_in_child=_pool.reset_after_fork)
+
 
 def get_connection():
+    """Borrow a connection from the pool; close() returns it."""
+    return _pool.acquire()
+
+
+class _Cursor:
+    """Cursor proxy that translates statements for the backend and counts them."""
+
+    def __init__(self, uow, raw):
+        self._uow = uow
+        self._raw = raw
+
+    def execute(self, sql, params=()):
+        self._uow.queries     += 1
+        self._uow.round_trips += 1
+        with phase('db'):
+            return self._raw.execute(backend.sql(sql), params)
+
+    def executemany(self, sql, seq_params):
+        # mysql.connector folds a multi-row INSERT into a single statement.
+        seq_params = list(seq_params)
+        self._uow.queries     += len(seq_params)
+        self._uow.round_trips += 1
+        with phase('db'):
+            return self._raw.executemany(backend.sql(sql), seq_params)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._raw.close()
+
+
+class UnitOfWork:
+    """
+    One pooled connection and its transaction, borrowed on first use and
+    committed or rolled back by finish(). A failed statement marks the unit
+    rollback-only, so work done before it is never committed half-way.
+    Callbacks registered with on_commit() run only once a commit succeeds.
+    """
+
+    def __init__(self, pool):
+        self._pool         = pool
+        self._conn         = None
+        self.rollback_only = False
+        self._on_commit    = []
+        self.queries       = 0
+        self.round_trips   = 0
+
+    def connection(self):
+        if self._conn is None:
+            with phase('db'):
+                self._conn = self._pool.acquire()
+        return self._conn
+
+    def cursor(self):
+        return _Cursor(self, self.connection().cursor())
+
+    def on_commit(self, fn):
+        """Call fn() after this unit's transaction commits; drop it on rollback."""
+        self._on_commit.append(fn)
+
+    def rollback(self):
+        if self._conn is not None:
+            self._conn.rollback()
+            self.round_trips += 1
+
+    def finish(self, commit=True):
+        """End the transaction and return the connection; safe to repeat."""
+        conn, self._conn = self._conn, None
+        rollback_only, self.rollback_only = self.rollback_only, False
+        callbacks, self._on_commit = self._on_commit, []
+        commit = commit and not rollback_only
+        if conn is not None:
+            try:
+                if conn.in_transaction:
+                    self.round_trips += 1
+                    with phase('db'):
+                        if commit:
+                            conn.commit()
+                        else:
+                            conn.rollback()
+            finally:
+                conn.close()
+        if commit:
+            for fn in callbacks:
+                fn()
+
+
+_current = contextvars.ContextVar('unit_of_work', default=None)
+
+
+@contextlib.contextmanager
+def request_scope():
+    """
+    Share one UnitOfWork between everything that runs inside the block
+    (handlers, auth, storage), finishing it once at the end.
+    """
+    uow   = UnitOfWork(_pool)
+    token = _current.set(uow)
+    try:
+        yield uow
+    except BaseException:
+        uow.finish(commit=False)
+        raise
+    else:
+        uow.finish()
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def separate_transaction():
+    """
+    Run the block outside any enclosing request_scope(): storage calls in
+    it use standalone units, so their failure cannot roll back the request.
+    """
+    token = _current.set(None)
     try:
-        return mysql.connector.connect(
-            host       = DB_HOST,
-            port       = DB_PORT,
-            user       = DB_USER,
-            password   = DB_PASSWORD,
-            database   = DB_NAME,
-            charset    = 'utf8mb4',
-            autocommit = False
-        )
-    except Error as err:
-        print(f"DB connection error: {err}")
+        yield
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def unit_of_work():
+    """
+    The UnitOfWork of the enclosing request_scope(), or else a standalone
+    one committed when the block exits cleanly.
+    """
+    uow = _current.get()
+    if uow is not None:
+        try:
+            yield uow
+        except BaseException:
+            uow.rollback_only = True
+            raise
+        return
+
+    uow = UnitOfWork(_pool)
+    try:
+        yield uow
+    except BaseException:
+        uow.finish(commit=False)
         raise
+    else:
+        uow.finish()
+
+
+def on_commit(fn):
+    """
+    Call fn() once the enclosing request_scope() commits, or right away
+    outside one, where storage calls have already committed on their own.
+    """
+    uow = _current.get()
+    if uow is None:
+        fn()
+    else:
+        uow.on_commit(fn)
+
+
+def pool_stats():
+    """Counters for the shared pool: size, idle, in_use, waits, creates, ..."""
+    return _pool.stats()
@@ -0,0 +1,229 @@
+# forms.py
+#
+# Incremental request-body parsing for POSTed forms. The body is read in
+# small chunks against a size limit, a field-count limit and a deadline,
+# so an oversized or trickling upload is refused without being buffered
+# and without pinning a worker for longer than FORM_READ_TIMEOUT.
+
+import os
+import time
+import tempfile
+import urllib.parse
+from email.message import Message
+
+FORM_MAX_BODY     = int(os.getenv('FORM_MAX_BODY', 64 * 1024))        # bytes
+FORM_MAX_FIELDS   = int(os.getenv('FORM_MAX_FIELDS', 32))
+FORM_READ_TIMEOUT = float(os.getenv('FORM_READ_TIMEOUT', 10))         # seconds
+FORM_SPOOL_SIZE   = int(os.getenv('FORM_SPOOL_SIZE', 64 * 1024))      # then disk
+
+_CHUNK_SIZE       = 8 * 1024
+_MAX_PART_HEADERS = 8 * 1024
+_MAX_FIELD_SIZE   = 64 * 1024   # a non-file multipart field
+
+
+class FormError(ValueError):
+    """A request body that was refused; `status` is the HTTP code to send."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadedFile:
+    """A multipart file part, spooled to disk once it outgrows memory."""
+
+    def __init__(self, filename, content_type, file):
+        self.filename     = filename
+        self.content_type = content_type
+        self.file         = file
+        self.size         = 0
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def close(self):
+        self.file.close()
+
+
+def _header(name, value):
+    # email.message parses header parameters (boundary=, filename=, ...).
+    msg = Message()
+    msg[name] = value
+    return msg
+
+
+class _BodyReader:
+    """Hands out the body a chunk at a time, enforcing the read deadline."""
+
+    def __init__(self, stream, length, timeout):
+        self._stream   = stream
+        self._left     = length
+        self._deadline = time.monotonic() + timeout
+        # read1 returns what one recv brought in instead of waiting for a
+        # full chunk, so a trickling client is caught at the deadline.
+        self._read = getattr(stream, 'read1', stream.read)
+
+    def read(self) -> bytes:
+        if not self._left:
+            return b''
+        if time.monotonic() > self._deadline:
+            raise FormError(408, 'Request body took too long')
+        data = self._read(min(self._left, _CHUNK_SIZE))
+        if not data:
+            raise FormError(400, 'Request body ended early')
+        self._left -= len(data)
+        return data
+
+
+def _add(form, name, value, max_fields):
+    if sum(map(len, form.values())) >= max_fields:
+        raise FormError(413, 'Too many form fields')
+    form.setdefault(name, []).append(value)
+
+
+def _parse_urlencoded(reader, max_fields):
+    form   = {}
+    buffer = b''
+
+    def add_pair(pair):
+        try:
+            text = pair.decode('utf-8')
+        except UnicodeDecodeError:
+            raise FormError(400, 'Form data is not UTF-8') from None
+        # Same rules as parse_qs: blank values are dropped.
+        for name, value in urllib.parse.parse_qsl(text):
+            _add(form, name, value, max_fields)
+
+    while True:
+        chunk = reader.read()
+        if not chunk:
+            break
+        *pairs, buffer = (buffer + chunk).split(b'&')
+        for pair in pairs:
+            add_pair(pair)
+    add_pair(buffer)
+    return form
+
+
+def _parse_multipart(reader, boundary, max_fields, allow_files):
+    """
+    Split a multipart/form-data body part by part. Plain fields are kept
+    as strings; file parts stream into an UploadedFile, so no more than a
+    chunk and a delimiter of any file are held in memory at once.
+    """
+    delimiter = b'--' + boundary.encode('latin-1')
+    separator = b'\r\n' + delimiter
+    form   = {}
+    buffer = b''
+
+    def fill():
+        nonlocal buffer
+        chunk = reader.read()
+        if not chunk:
+            raise FormError(400, 'Malformed multipart body')
+        buffer += chunk
+
+    # Preamble up to the first delimiter.
+    while delimiter not in buffer:
+        if len(buffer) > _MAX_PART_HEADERS:
+            raise FormError(400, 'Malformed multipart body')
+        fill()
+    buffer = buffer[buffer.index(delimiter) + len(delimiter):]
+
+    while True:
+        while len(buffer) < 2:
+            fill()
+        if buffer.startswith(b'--'):
+            return form
+        if not buffer.startswith(b'\r\n'):
+            raise FormError(400, 'Malformed multipart body')
+
+        while b'\r\n\r\n' not in buffer:
+            if len(buffer) > _MAX_PART_HEADERS:
+                raise FormError(431, 'Multipart headers too large')
+            fill()
+        head, buffer = buffer[2:].split(b'\r\n\r\n', 1)
+        headers = {}
+        for line in head.decode('latin-1').split('\r\n'):
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        disposition = _header('content-disposition',
+                              headers.get('content-disposition', ''))
+        name     = disposition.get_param('name', header='content-disposition')
+        filename = disposition.get_param('filename', header='content-disposition')
+        if not name:
+            raise FormError(400, 'Multipart part without a name')
+
+        if filename is not None and not allow_files:
+            raise FormError(400, 'File uploads are not accepted here')
+        if filename is not None:
+            target = UploadedFile(
+                filename, headers.get('content-type', 'application/octet-stream'),
+                tempfile.SpooledTemporaryFile(max_size=FORM_SPOOL_SIZE))
+            _add(form, name, target, max_fields)
+            write = target.file.write
+        else:
+            data = bytearray()
+            def write(part, data=data):
+                if len(data) + len(part) > _MAX_FIELD_SIZE:
+                    raise FormError(413, 'Form field too large')
+                data += part
+
+        # Stream the part body out, holding back anything that could be
+        # the start of the next delimiter.
+        while True:
+            end = buffer.find(separator)
+            if end != -1:
+                write(buffer[:end])
+                buffer = buffer[end + len(separator):]
+                break
+            keep = len(separator) - 1
+            if len(buffer) > keep:
+                write(buffer[:-keep])
+                buffer = buffer[-keep:]
+            fill()
+
+        if filename is not None:
+            target.size = target.file.tell()
+            target.file.seek(0)
+        else:
+            try:
+                _add(form, name, data.decode('utf-8'), max_fields)
+            except UnicodeDecodeError:
+                raise FormError(400, 'Form data is not UTF-8') from None
+
+
+def parse_body(stream, headers, max_body=FORM_MAX_BODY,
+               max_fields=FORM_MAX_FIELDS, timeout=FORM_READ_TIMEOUT,
+               allow_files=False) -> dict:
+    """
+    Parse an application/x-www-form-urlencoded or multipart/form-data body
+    into {name: [value, ...]} like urllib.parse.parse_qs. With allow_files,
+    multipart file parts come back as UploadedFile objects; otherwise they
+    are refused, so every value is a string. Raises FormError with the
+    status to answer with; an oversized Content-Length is refused before
+    any of the body is read.
+    """
+    try:
+        length = int(headers.get('Content-Length', 0))
+    except ValueError:
+        raise FormError(400, 'Bad Content-Length') from None
+    if length < 0:
+        raise FormError(400, 'Bad Content-Length')
+    if length > max_body:
+        raise FormError(413, 'Request body too large')
+
+    content_type = _header('content-type', headers.get(
+        'Content-Type', 'application/x-www-form-urlencoded'))
+    reader = _BodyReader(stream, length, timeout)
+
+    kind = content_type.get_content_type()
+    if kind == 'application/x-www-form-urlencoded':
+        return _parse_urlencoded(reader, max_fields)
+    if kind == 'multipart/form-data':
+        boundary = content_type.get_param('boundary')
+        if not boundary:
+            raise FormError(400, 'Multipart body without a boundary')
+        return _parse_multipart(reader, boundary, max_fields, allow_files)
+    raise FormError(415, f'Unsupported form encoding: {kind}')
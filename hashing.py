@@ -0,0 +1,266 @@
+# hashing.py
+
+import os
+import time
+import base64
+import asyncio
+import hashlib
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+# Hashing processes per server process (0 = inline). Left unset, the
+# machine's cores are split between prefork workers; see share_cores().
+HASH_WORKERS    = int(os.getenv('HASH_WORKERS', os.cpu_count() or 1))
+_WORKERS_SET    = 'HASH_WORKERS' in os.environ
+HASH_QUEUE_SIZE = int(os.getenv('HASH_QUEUE_SIZE', 64))
+HASH_TIMEOUT    = float(os.getenv('HASH_TIMEOUT', 10))
+
+
+class HashingUnavailable(RuntimeError):
+    """Raised when the hashing queue is full or a hash does not finish in time."""
+
+
+def pbkdf2(password: bytes, salt: bytes, iterations: int) -> bytes:
+    # Module-level so it can be pickled into worker processes.
+    return hashlib.pbkdf2_hmac('sha256', password, salt, iterations)
+
+
+# Stored hashes read b'pbkdf2_sha256$<iterations>$<b64 salt>$<b64 dk>'.
+# Rows written before the format existed are a bare 48-byte salt||dk made
+# with LEGACY_ITERATIONS.
+HASH_ALGORITHM     = 'pbkdf2_sha256'
+LEGACY_ITERATIONS  = 100_000
+_LEGACY_HASH_SIZE  = 48
+
+
+def encode_hash(iterations: int, salt: bytes, dk: bytes) -> bytes:
+    return b'$'.join((HASH_ALGORITHM.encode('ascii'),
+                      str(iterations).encode('ascii'),
+                      base64.b64encode(salt), base64.b64encode(dk)))
+
+
+def decode_hash(stored) -> tuple:
+    """
+    Split a stored hash into (algorithm, iterations, salt, dk).
+    Raises ValueError for anything that is neither format.
+    """
+    stored = stored.encode('ascii') if isinstance(stored, str) else bytes(stored)
+    prefix = HASH_ALGORITHM.encode('ascii') + b'$'
+    if not stored.startswith(prefix):
+        if len(stored) != _LEGACY_HASH_SIZE:
+            raise ValueError("Unrecognised password hash format")
+        return HASH_ALGORITHM, LEGACY_ITERATIONS, stored[:16], stored[16:]
+
+    try:
+        algorithm, iterations, salt, dk = stored.split(b'$')
+        return (algorithm.decode('ascii'), int(iterations),
+                base64.b64decode(salt, validate=True),
+                base64.b64decode(dk, validate=True))
+    except ValueError:
+        raise ValueError("Malformed password hash") from None
+
+
+def make_hash(password: str, iterations: int) -> bytes:
+    """Salt and hash a password into the encoded stored format."""
+    salt = os.urandom(16)
+    return encode_hash(iterations, salt,
+                       pbkdf2(password.encode('utf-8'), salt, iterations))
+
+
+def calibrate(target_ms: float, probe_iterations: int = 20_000,
+              rounds: int = 5, step: int = 1_000) -> tuple:
+    """
+    Pick the PBKDF2 iteration count that takes about `target_ms` on one
+    core of this machine. Times `rounds` probes and uses the fastest, so a
+    busy moment does not talk the cost down. Returns (iterations, ms per
+    probe iteration).
+    """
+    salt = os.urandom(16)
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        pbkdf2(b'calibration', salt, probe_iterations)
+        best = min(best, time.perf_counter() - started)
+
+    per_iteration_ms = best * 1000 / probe_iterations
+    iterations = round(target_ms / per_iteration_ms / step) * step
+    return max(iterations, step), per_iteration_ms
+
+
+class HashingService:
+    """
+    Runs key derivation in a process pool sized to the machine's cores.
+
+    At most workers + queue_size derivations are pending at once; callers
+    past that wait up to `timeout` for a slot and then get
+    HashingUnavailable, so a burst of logins queues here instead of piling
+    up on request threads. With workers=0 derivation runs inline.
+    """
+
+    def __init__(self, workers=HASH_WORKERS, queue_size=HASH_QUEUE_SIZE,
+                 timeout=HASH_TIMEOUT):
+        self.queue_size = queue_size
+        self.timeout    = timeout
+        self._lock      = threading.Lock()
+        self._executor  = None
+        self.resize(workers)
+        self._pending   = 0
+        self._counters  = dict.fromkeys(
+            ('submitted', 'completed', 'rejected', 'timeouts'), 0)
+        self._latency_total = 0.0
+        self._latency_max   = 0.0
+
+    def resize(self, workers):
+        """Set the pool size; only before the first job is submitted."""
+        self.workers     = workers
+        self.max_pending = workers + self.queue_size if workers else 0
+        self._slots      = threading.BoundedSemaphore(self.max_pending or 1)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                methods = multiprocessing.get_all_start_methods()
+                # Never fork a multi-threaded server process into a worker.
+                ctx = multiprocessing.get_context(
+                    'forkserver' if 'forkserver' in methods else None)
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=ctx)
+            return self._executor
+
+    def _record(self, started):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._counters['completed'] += 1
+            self._latency_total += elapsed
+            if elapsed > self._latency_max:
+                self._latency_max = elapsed
+
+    def submit(self, fn, *args):
+        """Queue fn(*args) on the pool; returns a concurrent.futures.Future."""
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._counters['rejected'] += 1
+            raise HashingUnavailable("Hashing queue is full")
+
+        started = time.perf_counter()
+        with self._lock:
+            self._pending += 1
+            self._counters['submitted'] += 1
+
+        def done(future):
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+            if not future.cancelled():
+                self._record(started)
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+            raise
+        future.add_done_callback(done)
+        return future
+
+    def run(self, fn, *args):
+        if not self.workers:
+            started = time.perf_counter()
+            with self._lock:
+                self._counters['submitted'] += 1
+            result = fn(*args)
+            self._record(started)
+            return result
+
+        # One deadline covers waiting for a slot and waiting for the result.
+        deadline = time.monotonic() + self.timeout
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeout:
+            future.cancel()
+            with self._lock:
+                self._counters['timeouts'] += 1
+            raise HashingUnavailable("Hashing timed out")
+
+    async def run_async(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        if not self.workers:
+            return await loop.run_in_executor(None, self.run, fn, *args)
+
+        deadline = time.monotonic() + self.timeout
+        # Waiting for a slot blocks, so it happens off the event loop.
+        submitted = await loop.run_in_executor(None, self.submit, fn, *args)
+        future    = asyncio.wrap_future(submitted)
+        try:
+            return await asyncio.wait_for(future, max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._counters['timeouts'] += 1
+            raise HashingUnavailable("Hashing timed out")
+
+    def derive(self, password: bytes, salt: bytes, iterations: int) -> bytes:
+        return self.run(pbkdf2, password, salt, iterations)
+
+    async def derive_async(self, password: bytes, salt: bytes,
+                           iterations: int) -> bytes:
+        return await self.run_async(pbkdf2, password, salt, iterations)
+
+    def reset_after_fork(self):
+        # Worker processes belong to the parent; start a fresh pool lazily.
+        self._lock     = threading.Lock()
+        self._executor = None
+        self._slots    = threading.BoundedSemaphore(self.max_pending or 1)
+        self._pending  = 0
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['workers']       = self.workers
+            stats['pending']       = self._pending
+            stats['max_pending']   = self.max_pending
+            stats['latency_total'] = self._latency_total
+            stats['latency_max']   = self._latency_max
+        return stats
+
+
+service = HashingService()
+os.register_at_fork(after_in_child=service.reset_after_fork)
+
+
+def share_cores(processes):
+    """
+    Give each of `processes` server processes (prefork workers) its share
+    of the cores, so together they run one hashing process per core rather
+    than one per core each. An explicit HASH_WORKERS is left alone.
+    """
+    if not _WORKERS_SET and service.workers:
+        service.resize(max(1, HASH_WORKERS // max(processes, 1)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Measure PBKDF2 on this machine and suggest PBKDF2_ITERATIONS')
+    parser.add_argument('--target-ms', type=float, default=250,
+                        help='latency budget for one hash on one core')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    iterations, per_iteration_ms = calibrate(args.target_ms, rounds=args.rounds)
+    hash_ms = iterations * per_iteration_ms
+    cores   = HASH_WORKERS or 1
+    print(f"PBKDF2_ITERATIONS={iterations}")
+    print(f"~{hash_ms:.0f} ms per hash, "
+          f"~{cores * 1000 / hash_ms:.0f} hashes/s with HASH_WORKERS={cores}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+# import_users.py
+
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import storage
+from auth import PBKDF2_ITERATIONS
+from hashing import make_hash
+from validation import (
+    is_valid_email,
+    is_valid_nickname,
+    is_strong_password
+)
+
+
+def read_records(path, fmt):
+    """Yield (record_no, dict) from a CSV (with header) or JSONL file."""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            for no, row in enumerate(csv.DictReader(f), start=1):
+                yield no, row
+            return
+        for no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield no, row if isinstance(row, dict) else None
+
+
+def validate(record):
+    """Return (username, email, password) or a rejection reason string."""
+    if record is None:
+        return 'Malformed record'
+    username = str(record.get('username') or '').strip()
+    email    = str(record.get('email') or '').strip()
+    password = str(record.get('password') or '')
+    if not is_valid_nickname(username):
+        return 'Invalid username'
+    if not is_valid_email(email):
+        return 'Invalid email'
+    if not is_strong_password(password):
+        return 'Weak password'
+    return username, email, password
+
+
+def read_checkpoint(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path, record_no):
+    # Write-then-rename so an interrupted run never leaves a torn file.
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(str(record_no))
+    os.replace(tmp, path)
+
+
+class Importer:
+    def __init__(self, pool, iterations, rejects):
+        self.pool       = pool
+        self.iterations = iterations
+        self.rejects    = rejects
+        self.inserted   = 0
+        self.rejected   = 0
+
+    def reject(self, record_no, record, reason):
+        record = record or {}
+        self.rejects.writerow([record_no, record.get('username', ''),
+                               record.get('email', ''), reason])
+        self.rejected += 1
+
+    def hash_batch(self, rows):
+        """Start hashing a batch on the pool; returns a lazy result iterator."""
+        passwords = [password for _, _, _, password in rows]
+        return self.pool.map(make_hash, passwords,
+                             itertools.repeat(self.iterations),
+                             chunksize=max(1, len(rows) // 32))
+
+    def insert_batch(self, rows, hashes):
+        """Insert a hashed batch; returns the duplicates as reject() args."""
+        if not rows:
+            return []
+        params = [(username, email, pwd_hash)
+                  for (_, username, email, _), pwd_hash in zip(rows, hashes)]
+        skipped = set(storage.create_users(params))
+        self.inserted += len(params) - len(skipped)
+        duplicates = []
+        for index in sorted(skipped):
+            record_no, username, email, _ = rows[index]
+            duplicates.append((record_no, {'username': username, 'email': email},
+                               'Duplicate username or email'))
+        return duplicates
+
+
+def run_import(path, fmt, batch_size, workers, checkpoint, rejects_path,
+               iterations=PBKDF2_ITERATIONS, out=sys.stdout):
+    resume_after = read_checkpoint(checkpoint)
+    started = time.monotonic()
+    processed = 0
+
+    with open(rejects_path, 'a', encoding='utf-8', newline='') as rf, \
+            ProcessPoolExecutor(workers) as pool:
+        importer = Importer(pool, iterations, csv.writer(rf))
+
+        def batches():
+            # Rejects travel with their batch so they are written together
+            # with its checkpoint, never ahead of it.
+            batch, rejects, last_seen = [], [], resume_after
+            for record_no, record in read_records(path, fmt):
+                if record_no <= resume_after:
+                    continue
+                last_seen = record_no
+                result = validate(record)
+                if isinstance(result, str):
+                    rejects.append((record_no, record, result))
+                else:
+                    batch.append((record_no, *result))
+                if len(batch) >= batch_size or len(rejects) >= batch_size:
+                    yield batch, rejects, record_no
+                    batch, rejects = [], []
+            if batch or rejects:
+                yield batch, rejects, last_seen
+
+        # Hash batch N+1 on the pool while batch N is being inserted.
+        pending = None
+        for batch, rejects, last_no in itertools.chain(batches(), [(None,) * 3]):
+            hashed = None
+            if batch is not None:
+                hashed = (batch, importer.hash_batch(batch) if batch else (),
+                          rejects, last_no)
+            if pending is not None:
+                rows, hashes, held, done_no = pending
+                held += importer.insert_batch(rows, list(hashes))
+                for reject in sorted(held, key=lambda reject: reject[0]):
+                    importer.reject(*reject)
+                rf.flush()
+                write_checkpoint(checkpoint, done_no)
+                processed += len(rows)
+                elapsed = time.monotonic() - started
+                print(f"record {done_no}: {importer.inserted} inserted, "
+                      f"{importer.rejected} rejected, "
+                      f"{processed / elapsed:.0f} rows/s", file=out)
+            pending = hashed
+
+    elapsed = time.monotonic() - started
+    print(f"Done: {importer.inserted} inserted, {importer.rejected} rejected "
+          f"in {elapsed:.1f}s", file=out)
+    return importer.inserted, importer.rejected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Bulk-import users from CSV or JSONL '
+                    '(fields: username, email, password)')
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=('csv', 'jsonl'),
+                        help='default: from the file extension')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--checkpoint', help='default: <path>.checkpoint')
+    parser.add_argument('--rejects', help='default: <path>.rejects.csv')
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('jsonl' if args.path.endswith(('.jsonl', '.ndjson'))
+                          else 'csv')
+    run_import(
+        args.path, fmt,
+        batch_size   = args.batch_size,
+        workers      = args.workers,
+        checkpoint   = args.checkpoint or args.path + '.checkpoint',
+        rejects_path = args.rejects or args.path + '.rejects.csv'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+# metrics.py
+#
+# In-process counters, gauges and histograms rendered in the Prometheus text
+# exposition format. Recording is a dict update under a per-metric lock, so
+# it is cheap enough to stay on in production. Each process keeps its own
+# figures; in prefork mode every worker reports only what it served.
+
+import os
+import hmac
+import time
+import bisect
+import ipaddress
+import threading
+import contextlib
+import contextvars
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+# /metrics answers loopback clients, and anyone sending
+# "Authorization: Bearer <METRICS_TOKEN>" once a token is set.
+METRICS_TOKEN   = os.getenv('METRICS_TOKEN', '')
+
+# Seconds; spans a cached page (well under 1 ms) to a queued PBKDF2 hash.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return (str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+def _labels(names, values, extra='') -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name   = name
+        self.help   = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock   = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def expose(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f'{self.name}{_labels(self.labels, labels)} {_number(value)}'
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name    = name
+        self.help    = help
+        self.labels  = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}   # labels -> [per-bucket counts (+Inf last), sum]
+        self._lock   = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def count(self, *labels):
+        entry = self._values.get(labels)
+        return sum(entry[0]) if entry else 0
+
+    def expose(self):
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._values.items())
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = _labels(self.labels, labels, f'le="{_number(bound)}"')
+                yield f'{self.name}_bucket{le} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labels, labels)} {total!r}'
+            yield f'{self.name}_count{_labels(self.labels, labels)} {cumulative}'
+
+
+_registry   = []
+_collectors = []
+
+def register(metric):
+    _registry.append(metric)
+    return metric
+
+def register_collector(collect):
+    """
+    Add a callable returning [(name, kind, help, value)] that is sampled on
+    every scrape, for figures other modules already keep (pool stats, ...).
+    """
+    _collectors.append(collect)
+
+def render_metrics() -> bytes:
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.expose())
+    for collect in _collectors:
+        for name, kind, help, value in collect():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name} {_number(value)}')
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+REQUESTS = register(Counter(
+    'http_requests_total', 'Requests served.', ('method', 'route', 'status')))
+IN_FLIGHT = register(Gauge(
+    'http_requests_in_flight', 'Requests being handled right now.'))
+DURATION = register(Histogram(
+    'http_request_duration_seconds', 'Time from request line to handler return.',
+    ('route', 'status')))
+PHASES = register(Histogram(
+    'http_request_phase_seconds',
+    'Time per request spent in each phase '
+    '(parse, db, hash, captcha, render, compress, write).',
+    ('route', 'status', 'phase')))
+
+
+class RequestTimer:
+    """Seconds spent per phase during one request."""
+    __slots__ = ('phases',)
+
+    def __init__(self):
+        self.phases = {}
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+
+_timer = contextvars.ContextVar('request_timer', default=None)
+
+@contextlib.contextmanager
+def request_timer():
+    """Collect phase() timings made on this thread while the block runs."""
+    timer = RequestTimer()
+    token = _timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _timer.reset(token)
+
+@contextlib.contextmanager
+def phase(name):
+    """Charge the block's wall time to `name` on the current request."""
+    timer = _timer.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - started)
+
+def scrape_allowed(client_ip, authorization=None) -> bool:
+    """Whether a request from client_ip may read the metrics page."""
+    if METRICS_TOKEN and authorization and hmac.compare_digest(
+            authorization.encode('utf-8', 'replace'),
+            f'Bearer {METRICS_TOKEN}'.encode('utf-8')):
+        return True
+    try:
+        return ipaddress.ip_address(client_ip).is_loopback
+    except ValueError:
+        return False
+
+def observe_request(method, route, status, seconds, phases):
+    if not METRICS_ENABLED:
+        return
+    status = str(status)
+    REQUESTS.inc(method, route, status)
+    DURATION.observe(seconds, route, status)
+    for name, spent in phases.items():
+        PHASES.observe(spent, route, status, name)
+
+
+class TimedWriter:
+    """wfile proxy charging socket writes to the 'write' phase."""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def write(self, data):
+        with phase('write'):
+            return self._raw.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
@@ -0,0 +1,65 @@
+# pages.py
+#
+# Pages that are the same for every anonymous visitor are rendered once per
+# template version and then served as stored bytes.
+
+import hashlib
+import functools
+
+from templates import get_template, render
+from utils import send_html
+
+_HOLE = '\x00hole\x00'
+
+
+class _Page:
+    __slots__ = ('template', 'parts', 'etag')
+
+    def __init__(self, template, parts):
+        self.template = template
+        self.parts    = parts
+        self.etag     = None
+        if len(parts) == 1:
+            self.etag = f'"{hashlib.sha1(parts[0]).hexdigest()[:20]}"'
+
+
+_pages = {}   # (template name, context items, hole) -> _Page
+
+def get_page(template_name, context, hole=None) -> _Page:
+    """
+    The rendered page for this context, split into parts around the `hole`
+    variable if one is named. Rebuilt whenever the template is recompiled
+    (TEMPLATE_RELOAD); context values must be hashable.
+    """
+    key = (template_name, tuple(sorted(context.items())), hole)
+    template = get_template(template_name)
+    page = _pages.get(key)
+    if page is None or page.template is not template:
+        if hole:
+            context = dict(context, **{hole: _HOLE})
+        body = render(template_name, **context)
+        page = _pages[key] = _Page(template, body.split(_HOLE.encode()))
+    return page
+
+
+def cached_page(template_name, hole=None):
+    """
+    Declare a route as serving a cached anonymous page. The decorated
+    method returns the template context. Without a hole, the page is
+    sent with a strong ETag and revalidated with If-None-Match. With one,
+    the context value for `hole` (e.g. a per-request CAPTCHA id) is spliced
+    into the stored shell and the page is not cacheable downstream.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def route(handler):
+            context = method(handler)
+            if hole is None:
+                page = get_page(template_name, context)
+                return send_html(handler, 200, page.parts[0], cacheable=True,
+                                 etag=page.etag)
+            value = str(context.pop(hole)).encode('utf-8')
+            page  = get_page(template_name, context, hole)
+            return send_html(handler, 200, value.join(page.parts))
+        return route
+    return decorate
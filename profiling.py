@@ -0,0 +1,118 @@
+# profiling.py
+#
+# Opt-in cProfile sampling and a slow-request log for the HTTP handler.
+#
+#   PROFILE_EVERY=N     profile one request in N (0 = off)
+#   PROFILE_MIN_MS=M    keep a sampled profile only if the request took M ms
+#                       (with PROFILE_EVERY=1: profile only slow requests)
+#   PROFILE_DIR         where profiles go; the newest PROFILE_KEEP are kept
+#   SLOW_REQUEST_MS     log requests slower than this with their phase
+#                       breakdown and query count (0 = off)
+
+import os
+import io
+import time
+import pstats
+import cProfile
+import tempfile
+import itertools
+import threading
+
+PROFILE_EVERY   = int(os.getenv('PROFILE_EVERY', 0))
+PROFILE_MIN_MS  = float(os.getenv('PROFILE_MIN_MS', 0))
+PROFILE_DIR     = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(),
+                                                        'registration_app_profiles'))
+PROFILE_KEEP    = int(os.getenv('PROFILE_KEEP', 50))
+PROFILE_TOP     = int(os.getenv('PROFILE_TOP', 30))
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', 1000))
+
+
+class Sampler:
+    """
+    Decides which requests to profile and writes their profiles out.
+
+    The profiler hooks the whole interpreter, so only one request is
+    profiled at a time; a sample that comes up while another is running is
+    skipped rather than waited for.
+    """
+
+    def __init__(self, every=PROFILE_EVERY, min_ms=PROFILE_MIN_MS,
+                 directory=PROFILE_DIR, keep=PROFILE_KEEP, top=PROFILE_TOP):
+        self.every     = every
+        self.min_ms    = min_ms
+        self.directory = directory
+        self.keep      = keep
+        self.top       = top
+        self._ticket   = itertools.count(1)
+        self._written  = itertools.count(1)
+        self._busy     = threading.Lock()
+
+    def start(self):
+        """Return an enabled profiler if this request is sampled, else None."""
+        if self.every <= 0 or next(self._ticket) % self.every:
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Some other tool (a debugger, coverage) owns the profiling hook.
+            self._busy.release()
+            return None
+        return profiler
+
+    def finish(self, profiler, label, seconds):
+        """Stop the profiler; keep its output if the request was slow enough."""
+        try:
+            profiler.disable()
+        finally:
+            self._busy.release()
+        if seconds * 1000 < self.min_ms:
+            return None
+        return self._write(profiler, label, seconds)
+
+    def _write(self, profiler, label, seconds):
+        os.makedirs(self.directory, exist_ok=True)
+        slug = ''.join(c if c.isalnum() else '_' for c in label).strip('_')
+        base = os.path.join(self.directory,
+                            f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-"
+                            f"{next(self._written):06d}-{slug}-"
+                            f"{seconds * 1000:.0f}ms")
+        profiler.dump_stats(base + '.prof')
+
+        out = io.StringIO()
+        out.write(f"{label}: {seconds * 1000:.1f} ms\n\n")
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(self.top)
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(out.getvalue())
+
+        self._rotate()
+        return base + '.txt'
+
+    def _rotate(self):
+        # Names start with a timestamp, so sorting them sorts by age.
+        profiles = sorted(name for name in os.listdir(self.directory)
+                          if name.endswith('.prof'))
+        for name in profiles[:max(len(profiles) - self.keep, 0)]:
+            for path in (name, name[:-len('.prof')] + '.txt'):
+                try:
+                    os.remove(os.path.join(self.directory, path))
+                except FileNotFoundError:
+                    pass
+
+
+sampler = Sampler()
+
+
+def log_slow_request(method, path, status, seconds, phases, queries,
+                     round_trips, threshold_ms=SLOW_REQUEST_MS):
+    """Print one line for a request slower than threshold_ms; True if it was."""
+    if threshold_ms <= 0 or seconds * 1000 < threshold_ms:
+        return False
+    breakdown = ' '.join(f"{name}={spent * 1000:.1f}ms" for name, spent in
+                         sorted(phases.items(), key=lambda item: -item[1]))
+    print(f"Slow request: {method} {path} {status} {seconds * 1000:.1f}ms "
+          f"[{breakdown or 'no phases'}] queries={queries} "
+          f"round_trips={round_trips}")
+    return True
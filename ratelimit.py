@@ -0,0 +1,179 @@
+# ratelimit.py
+#
+# Token buckets per client IP and per email address in front of the
+# password-hashing routes, so rejected attempts never reach PBKDF2.
+
+import os
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+
+from sqlite_local import LocalConnections
+
+RATE_LIMIT_STORE     = os.getenv('RATE_LIMIT_STORE', 'auto')     # auto | memory | sqlite
+RATE_LIMIT_PATH      = os.getenv(
+    'RATE_LIMIT_PATH',
+    os.path.join(tempfile.gettempdir(), 'registration_app_ratelimit.db'))
+RATE_LIMIT_MAX_KEYS  = int(os.getenv('RATE_LIMIT_MAX_KEYS', 100_000))
+
+# Sustained attempts per minute and burst size; a rate of 0 disables a rule.
+RATE_IP_PER_MINUTE    = float(os.getenv('RATE_IP_PER_MINUTE', 30))
+RATE_IP_BURST         = float(os.getenv('RATE_IP_BURST', 30))
+RATE_EMAIL_PER_MINUTE = float(os.getenv('RATE_EMAIL_PER_MINUTE', 5))
+RATE_EMAIL_BURST      = float(os.getenv('RATE_EMAIL_BURST', 10))
+
+# Behind a load balancer, the header carrying the client address
+# (e.g. X-Forwarded-For); its last entry is the one the balancer saw.
+RATE_LIMIT_CLIENT_HEADER = os.getenv('RATE_LIMIT_CLIENT_HEADER', '')
+
+
+def _refill(tokens, updated, now, rate, burst):
+    return min(burst, tokens + (now - updated) * rate)
+
+
+class MemoryBucketStore:
+    """
+    Per-process buckets in an LRU capped at max_keys. An evicted key comes
+    back with a full bucket, so the cap bounds memory, not strictness for
+    the most active clients (which stay at the recent end).
+    """
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._data = OrderedDict()   # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now=None) -> float:
+        """Spend one token; return 0 if allowed, else seconds until one is free."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._data.pop(key, None)
+            tokens = burst if entry is None else _refill(*entry, now, rate, burst)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self._data[key] = (tokens, now)
+            while len(self._data) > self.max_keys:
+                self._data.popitem(last=False)
+        return wait
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBucketStore:
+    """
+    Buckets shared by every worker process on a host through one SQLite
+    file in WAL mode. Each take() is one short write transaction; buckets
+    idle long enough to have refilled are deleted a few at a time.
+    """
+
+    _PURGE_BATCH = 64
+
+    def __init__(self, path=RATE_LIMIT_PATH, idle_after=600.0):
+        self.path       = path
+        self.idle_after = idle_after
+        self._conns     = LocalConnections(path)
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                key     TEXT PRIMARY KEY,
+                tokens  REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_buckets_updated ON buckets (updated);
+        """)
+
+    def _conn(self):
+        return self._conns.get()
+
+    def take(self, key, rate, burst, now=None) -> float:
+        """Spend one token; return 0 if allowed, else seconds until one is free."""
+        now  = time.time() if now is None else now
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?",
+                               (key,)).fetchone()
+            tokens = burst if row is None else _refill(*row, now, rate, burst)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) "
+                         "VALUES (?, ?, ?)", (key, tokens, now))
+            conn.execute(
+                "DELETE FROM buckets WHERE key IN "
+                "(SELECT key FROM buckets WHERE updated < ? LIMIT ?)",
+                (now - self.idle_after, self._PURGE_BATCH))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return wait
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+
+
+class RateLimiter:
+    """Per-IP and per-email rules over one bucket store."""
+
+    def __init__(self, store, ip_rule=(RATE_IP_PER_MINUTE, RATE_IP_BURST),
+                 email_rule=(RATE_EMAIL_PER_MINUTE, RATE_EMAIL_BURST)):
+        self.store      = store
+        self.ip_rule    = ip_rule
+        self.email_rule = email_rule
+        self._lock      = threading.Lock()
+        self._counters  = dict.fromkeys(('allowed', 'limited_ip', 'limited_email'), 0)
+
+    def _take(self, scope, key, rule, now):
+        per_minute, burst = rule
+        if per_minute <= 0:
+            return 0.0
+        return self.store.take(f'{scope}:{key}', per_minute / 60, burst, now)
+
+    def check(self, ip, email=None, now=None) -> float:
+        """0 if the attempt may proceed, else seconds the client should wait."""
+        wait, scope = self._take('ip', ip, self.ip_rule, now), 'limited_ip'
+        if not wait and email:
+            wait  = self._take('email', email.strip().lower(), self.email_rule, now)
+            scope = 'limited_email'
+        with self._lock:
+            self._counters[scope if wait else 'allowed'] += 1
+        return wait
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats['keys'] = len(self.store)
+        return stats
+
+
+def make_limiter(shared=False, kind=None):
+    """
+    Build a limiter on the configured store. With shared=True the buckets
+    should be visible to every worker process; 'auto' picks sqlite then.
+    """
+    kind = kind or RATE_LIMIT_STORE
+    if kind == 'auto':
+        kind = 'sqlite' if shared else 'memory'
+    if kind == 'sqlite':
+        return RateLimiter(SQLiteBucketStore())
+    if kind == 'memory':
+        if shared:
+            print("Warning: RATE_LIMIT_STORE=memory is per process; each "
+                  "worker lets through its own share of attempts")
+        return RateLimiter(MemoryBucketStore())
+    raise RuntimeError(f"Unknown RATE_LIMIT_STORE: {kind}")
+
+
+def client_ip(handler) -> str:
+    if RATE_LIMIT_CLIENT_HEADER:
+        forwarded = handler.headers.get(RATE_LIMIT_CLIENT_HEADER, '')
+        if forwarded:
+            return forwarded.rsplit(',', 1)[-1].strip()
+    return handler.client_address[0]
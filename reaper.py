@@ -0,0 +1,70 @@
+# reaper.py
+
+import os
+import time
+import argparse
+import threading
+
+import storage
+
+SESSION_REAPER_INTERVAL = float(os.getenv('SESSION_REAPER_INTERVAL', 0))   # 0 = off
+SESSION_REAPER_BATCH    = int(os.getenv('SESSION_REAPER_BATCH', 500))
+SESSION_REAPER_PAUSE    = float(os.getenv('SESSION_REAPER_PAUSE', 0.05))
+
+def reap_expired_sessions(batch_size=SESSION_REAPER_BATCH,
+                          pause=SESSION_REAPER_PAUSE, max_batches=None) -> int:
+    """
+    Delete expired sessions in small batches walked through the expires
+    index, committing after each one so no batch holds locks for long.
+    Sleeps `pause` seconds between batches to cap the delete rate.
+    Returns the number of rows removed.
+    """
+    total   = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        deleted  = storage.delete_expired_sessions(batch_size)
+        total   += deleted
+        batches += 1
+        if deleted < batch_size:
+            break
+        time.sleep(pause)
+    return total
+
+def _run_forever(interval, stop, batch_size, pause):
+    while not stop.wait(interval):
+        try:
+            reaped = reap_expired_sessions(batch_size, pause)
+            print(f"Session reaper: removed {reaped} expired sessions")
+        except Exception as err:
+            print(f"Session reaper error: {err}")
+
+def start_reaper(interval=SESSION_REAPER_INTERVAL, batch_size=SESSION_REAPER_BATCH,
+                 pause=SESSION_REAPER_PAUSE):
+    """Run the reaper every `interval` seconds on a daemon thread."""
+    stop   = threading.Event()
+    thread = threading.Thread(target=_run_forever, name='session-reaper',
+                              args=(interval, stop, batch_size, pause),
+                              daemon=True)
+    thread.start()
+    return stop
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Delete expired sessions')
+    parser.add_argument('--batch-size', type=int, default=SESSION_REAPER_BATCH)
+    parser.add_argument('--pause', type=float, default=SESSION_REAPER_PAUSE,
+                        help='seconds to sleep between batches')
+    parser.add_argument('--interval', type=float, default=0,
+                        help='repeat every N seconds instead of running once')
+    args = parser.parse_args(argv)
+
+    while True:
+        started = time.monotonic()
+        reaped  = reap_expired_sessions(args.batch_size, args.pause)
+        print(f"Removed {reaped} expired sessions "
+              f"in {time.monotonic() - started:.2f}s")
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,24 @@
 # server.py
 
 import os
-import base64
+import re
+import html
+import math
+import time
 import datetime
-from http.server import HTTPServer, BaseHTTPRequestHandler
-
-from db import get_connection
+import json
+import argparse
+import urllib.parse
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler
+
+import storage
+import metrics
+import profiling
+import compress
+from db import request_scope, pool_stats, on_commit
 from templates import render
+from pages import cached_page, get_page
 from utils import (
     parse_form,
     send_html,
@@ -17,22 +29,142 @@ from utils import (
 from auth import (
     hash_password,
     check_password,
+    upgrade_password_hash,
     create_session,
-    get_user_from_session
+    get_user_from_session,
+    end_session,
+    invalidate_user,
+    session_cache_stats,
+    SESSION_MODE
 )
 from validation import (
     is_valid_email,
     is_valid_nickname,
     is_strong_password
 )
+from hashing import HashingUnavailable, service as hashing_service, share_cores
+from forms import FORM_MAX_BODY, FormError
+from ratelimit import make_limiter, client_ip
+from static import serve_file
 from captcha import (
     generate_captcha,
-    verify_captcha
+    get_captcha_image,
+    verify_captcha,
+    captcha_pool_stats,
+    share_store as share_captcha_store
+)
+from captcha_store import CAPTCHA_TTL
+from serving import (
+    MODES,
+    KeepAliveMixin,
+    make_server,
+    serve,
+    serve_prefork
+)
+from aioserver import serve_async
+from reaper import SESSION_REAPER_INTERVAL, start_reaper
+from availability import (
+    AVAILABILITY_REBUILD_INTERVAL,
+    index as availability,
+    start_rebuilder
 )
 
 # Directory for static files
 STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
 
+# HTTP/1.1 persistent connections
+KEEPALIVE_TIMEOUT      = float(os.getenv('KEEPALIVE_TIMEOUT', 5))   # idle seconds
+KEEPALIVE_MAX_REQUESTS = int(os.getenv('KEEPALIVE_MAX_REQUESTS', 100))
+MAX_DRAIN_BYTES        = 8 * 1024    # unread body skipped to keep a connection
+DRAIN_TIMEOUT          = 1.0         # seconds a client gets to send it
+
+# Errors after which the rest of the request stream cannot be trusted.
+_CLOSE_ON_ERROR = {400, 408, 411, 413, 414, 431}
+
+# Largest form body each POST route accepts (forms.FORM_MAX_BODY for any
+# other); a bigger Content-Length gets 413 before the body is read.
+_FORM_LIMITS = {'/register': 8 * 1024, '/login': 4 * 1024, '/account': 8 * 1024}
+
+_CAPTCHA_PATH = re.compile(r'^/captcha/([0-9a-f-]{36})\.png$')
+
+# Attempts per client IP and per email on the routes that run PBKDF2.
+_limiter = make_limiter()
+
+# Exact paths served by Handler; anything else is grouped so a scan of
+# random URLs cannot blow up the number of metric series.
+_ROUTES = {'/', '/register', '/login', '/account', '/profile', '/logout',
+           '/metrics', '/api/availability'}
+
+
+def _route_label(path):
+    path = path.split('?', 1)[0]
+    if path in _ROUTES:
+        return path
+    if path.startswith('/static/'):
+        return '/static/'
+    if path.startswith('/captcha/'):
+        return '/captcha/'
+    return 'other'
+
+
+def _collect_stats():
+    # Figures the pools and caches already keep, sampled on each scrape.
+    db, hashing = pool_stats(), hashing_service.stats()
+    sessions, captchas = session_cache_stats(), captcha_pool_stats()
+    compressed = compress.cache_stats()
+    limits = _limiter.stats()
+    names = availability.stats()
+    return [
+        ('db_pool_connections', 'gauge', 'Open pooled DB connections.', db['size']),
+        ('db_pool_in_use', 'gauge', 'Pooled DB connections lent out.', db['in_use']),
+        ('db_pool_waits_total', 'counter', 'Acquires that had to wait.', db['waits']),
+        ('db_pool_timeouts_total', 'counter', 'Acquires that timed out.', db['timeouts']),
+        ('hashing_pending', 'gauge', 'Hash jobs queued or running.', hashing['pending']),
+        ('session_cache_hit_rate', 'gauge', 'Session cache hit rate.', sessions['hit_rate']),
+        ('captcha_pool_available', 'gauge', 'Pre-rendered CAPTCHAs ready.', captchas['available']),
+        ('captcha_pool_errors_total', 'counter', 'CAPTCHAs that failed to render.', captchas['errors']),
+        ('compress_cache_hits_total', 'counter', 'Compressed bodies reused.', compressed['hits']),
+        ('compress_cache_misses_total', 'counter', 'Cacheable bodies compressed.', compressed['misses']),
+        ('ratelimit_allowed_total', 'counter', 'Attempts let through.', limits['allowed']),
+        ('ratelimit_limited_ip_total', 'counter', 'Attempts refused per IP.', limits['limited_ip']),
+        ('ratelimit_limited_email_total', 'counter', 'Attempts refused per email.', limits['limited_email']),
+        ('ratelimit_keys', 'gauge', 'Tracked rate-limit buckets.', limits['keys']),
+        ('availability_indexed', 'gauge', 'Users in the availability filters.', names['indexed']),
+        ('availability_filtered_total', 'counter', 'Lookups answered by the filters.', names['filtered']),
+        ('availability_false_positives_total', 'counter', 'Filter hits the DB found free.', names['false_positives']),
+    ]
+
+metrics.register_collector(_collect_stats)
+
+
+class _CountingReader:
+    """rfile proxy counting the body bytes a route actually read."""
+
+    def __init__(self, raw):
+        self._raw     = raw
+        self.consumed = 0
+
+    def mark(self):
+        self.consumed = 0
+
+    def read(self, size=-1):
+        data = self._raw.read(size)
+        self.consumed += len(data)
+        return data
+
+    def read1(self, size=-1):
+        data = self._raw.read1(size)
+        self.consumed += len(data)
+        return data
+
+    def readline(self, size=-1):
+        line = self._raw.readline(size)
+        self.consumed += len(line)
+        return line
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
 
 def _nav_context(user):
     """
@@ -57,10 +189,181 @@ def _nav_context(user):
         }
 
 
-class Handler(BaseHTTPRequestHandler):
+class Handler(KeepAliveMixin, BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    timeout          = KEEPALIVE_TIMEOUT   # also bounds slow clients
+    # Headers and body go out in separate writes; on a reused connection
+    # Nagle would hold the body back until the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    unit_of_work = None
+    _logged      = None
+    _started     = None
+    _profiler    = None
+    _served      = 0   # requests on this connection
+    _body_length = 0
+
+    def setup(self):
+        super().setup()
+        self.rfile = _CountingReader(self.rfile)
+        self.wfile = metrics.TimedWriter(self.wfile)
+
+    def handle_one_request(self):
+        # Handlers, auth and storage share one connection and transaction
+        # per request; the access log line reports what it cost.
+        self._logged      = None
+        self._started     = None
+        self._profiler    = None
+        self._body_length = 0
+        try:
+            with metrics.request_timer() as timer, request_scope() as uow:
+                self.unit_of_work = uow
+                super().handle_one_request()
+                self._discard_unread_body()
+        finally:
+            self.unit_of_work = None
+            if self._started is not None:
+                elapsed = time.perf_counter() - self._started
+                metrics.IN_FLIGHT.dec()
+            if self._profiler is not None:
+                profiling.sampler.finish(
+                    self._profiler, f'{self.command} {_route_label(self.path)}',
+                    elapsed)
+        if self._logged:
+            code, size = self._logged
+            if self._started is not None:
+                route = _route_label(self.path)
+                metrics.observe_request(self.command, route, code, elapsed,
+                                        timer.phases)
+                profiling.log_slow_request(self.command, route, code, elapsed,
+                                           timer.phases, uow.queries,
+                                           uow.round_trips)
+            self.log_message('"%s" %s %s db=%dq/%drt', self.requestline,
+                             code, size, uow.queries, uow.round_trips)
+
+    def parse_request(self):
+        # Timing starts once a request line has arrived, not while the
+        # connection sits idle between keep-alive requests.
+        self._started  = time.perf_counter()
+        self._profiler = profiling.sampler.start()
+        self._served  += 1
+        metrics.IN_FLIGHT.inc()
+        if not super().parse_request():
+            return False
+
+        if self.headers.get('Transfer-Encoding'):
+            # Only Content-Length framed bodies (what browsers send for forms).
+            self.send_error(411)
+            return False
+        try:
+            self._body_length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            self._body_length = -1
+        if self._body_length < 0:
+            self.send_error(400, 'Bad Content-Length')
+            return False
+        if isinstance(self.rfile, _CountingReader):
+            self.rfile.mark()
+        return True
+
+    def _unread_body(self):
+        if not isinstance(self.rfile, _CountingReader):
+            return 0
+        return max(self._body_length - self.rfile.consumed, 0)
+
+    def _discard_unread_body(self):
+        # Skip any body the route did not read so the next request on this
+        # connection starts at its request line. A client too slow to send
+        # it within DRAIN_TIMEOUT is hung up on instead of holding a thread.
+        left = self._unread_body()
+        if not left or self.close_connection:
+            return
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        try:
+            while left:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if self.connection is not None:
+                    self.connection.settimeout(remaining)
+                data = self.rfile.read1(min(left, MAX_DRAIN_BYTES))
+                if not data:
+                    break
+                left -= len(data)
+        except OSError:
+            pass
+        finally:
+            if self.connection is not None:
+                self.connection.settimeout(self.timeout)
+        if left:
+            self.close_connection = True
+
+    def _must_close(self):
+        server = self.server
+        return (self._served >= KEEPALIVE_MAX_REQUESTS
+                or not getattr(server, 'keep_alive', True)
+                # Idle keep-alive connections hold pool threads that
+                # queued clients are waiting for.
+                or (hasattr(server, 'saturated') and server.saturated())
+                or self._unread_body() > MAX_DRAIN_BYTES)
+
+    def send_response(self, code, message=None):
+        # Commit before the client can see (and act on) the response.
+        if self.unit_of_work is not None:
+            self.unit_of_work.finish()
+        if not self.close_connection and self._must_close():
+            self.close_connection = True
+        super().send_response(code, message)
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        elif self.request_version == 'HTTP/1.0':
+            self.send_header('Connection', 'keep-alive')
+
+    def send_error(self, code, message=None, explain=None):
+        # The stock send_error always closes the connection; keep it when
+        # the request itself was well-formed (404, 405, ...).
+        if code in _CLOSE_ON_ERROR or code >= 500:
+            self.close_connection = True
+        shortmsg, longmsg = self.responses.get(code, ('???', '???'))
+        message = shortmsg if message is None else message
+        explain = longmsg if explain is None else explain
+        self.log_error("code %d, message %s", code, message)
+        self.send_response(code, message)
+
+        body = b''
+        if code >= 200 and code not in (204, 205, 304):
+            body = (self.error_message_format % {
+                'code':    code,
+                'message': html.escape(message, quote=False),
+                'explain': html.escape(explain, quote=False)
+            }).encode('utf-8', 'replace')
+            self.send_header('Content-Type', self.error_content_type)
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD' and body:
+            self.wfile.write(body)
+
+    def log_error(self, format, *args):
+        # An idle keep-alive connection timing out is routine.
+        if format.startswith('Request timed out'):
+            return
+        super().log_error(format, *args)
+
+    def release_db(self):
+        # Hand the connection back before PBKDF2 so it is not held idle for
+        # the whole derivation; the next query borrows one again.
+        self.unit_of_work.finish()
+
+    def log_request(self, code='-', size='-'):
+        if isinstance(code, HTTPStatus):
+            code = code.value
+        self._logged = (code, size)
+
     def do_GET(self):
         if self.path.startswith('/static/'):
             return self.serve_static()
+        if self.path.startswith('/captcha/'):
+            return self.serve_captcha()
 
         if self.path == '/':
             return self.show_home()
@@ -74,43 +377,109 @@ class Handler(BaseHTTPRequestHandler):
             return self.show_profile()
         if self.path == '/logout':
             return self.handle_logout()
+        if self.path == '/metrics' and metrics.METRICS_ENABLED:
+            return self.serve_metrics()
+        if self.path.split('?', 1)[0] == '/api/availability':
+            return self.serve_availability()
 
         return self.send_error(404)
 
     def do_POST(self):
-        if self.path == '/register':
-            return self.handle_register()
-        if self.path == '/login':
-            return self.handle_login()
-        if self.path == '/account':
-            return self.handle_account()
+        try:
+            if self.path == '/register':
+                return self.handle_register()
+            if self.path == '/login':
+                return self.handle_login()
+            if self.path == '/account':
+                return self.handle_account()
+        except HashingUnavailable:
+            return self.send_busy()
+        except FormError as err:
+            return self.send_error(err.status, str(err))
 
         return self.send_error(404)
 
+    @staticmethod
+    def body_limit(path):
+        # Also consulted by aioserver before it buffers a body.
+        return _FORM_LIMITS.get(path.split('?', 1)[0], FORM_MAX_BODY)
+
+    def read_form(self):
+        return parse_form(self, max_body=self.body_limit(self.path))
+
+    def send_busy(self):
+        # Password hashing is saturated: ask the client to retry shortly.
+        return self.send_retry_later(503, 1, b'Server busy, please try again')
+
+    def send_too_many(self, wait):
+        # Rate limited before any hashing or DB work was done.
+        return self.send_retry_later(429, math.ceil(wait),
+                                     b'Too many attempts, please wait')
+
+    def send_retry_later(self, status, seconds, body):
+        self.send_response(status)
+        self.send_header('Retry-After', str(seconds))
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def serve_metrics(self):
+        # Route-level traffic figures are for operators, not visitors.
+        if not metrics.scrape_allowed(client_ip(self),
+                                      self.headers.get('Authorization')):
+            return self.send_error(403)
+        body = metrics.render_metrics()
+        return send_html(self, 200, body,
+                         content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    def serve_availability(self):
+        # /api/availability?username=...&email=... ->
+        # {"username": "available" | "taken" | "invalid", ...}
+        # Limited per IP like login, as it reveals which accounts exist, and
+        # answered from the users table: another worker's filter may know a
+        # name this one has not seen yet.
+        wait = _limiter.check(client_ip(self))
+        if wait:
+            return self.send_too_many(wait)
+
+        query  = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        checks = (('username', is_valid_nickname), ('email', is_valid_email))
+        result = {}
+        for kind, is_valid in checks:
+            if kind not in query:
+                continue
+            value = query[kind][0].strip()
+            if not is_valid(value):
+                result[kind] = 'invalid'
+            else:
+                result[kind] = ('taken' if availability.taken(kind, value, exact=True)
+                                else 'available')
+        if not result:
+            return send_html(self, 400, b'Pass username and/or email')
+
+        body = json.dumps(result).encode('utf-8')
+        return send_html(self, 200, body, content_type='application/json')
+
     def serve_static(self):
         # Serve files under ./static/
-        rel_path = self.path[len('/static/'):].lstrip('/')
-        full_path = os.path.join(STATIC_DIR, rel_path)
-        if not os.path.isfile(full_path):
-            return self.send_error(404)
+        return serve_file(self, STATIC_DIR, self.path[len('/static/'):])
 
-        if full_path.endswith('.css'):
-            content_type = 'text/css'
-        elif full_path.endswith('.js'):
-            content_type = 'application/javascript'
-        else:
-            content_type = 'application/octet-stream'
+    def serve_captcha(self):
+        # Serve /captcha/<id>.png straight from the CAPTCHA store
+        m = _CAPTCHA_PATH.match(self.path.split('?', 1)[0])
+        png = get_captcha_image(m.group(1)) if m else None
+        if png is None:
+            return self.send_error(404)
 
-        try:
-            with open(full_path, 'rb') as f:
-                data = f.read()
-            self.send_response(200)
-            self.send_header('Content-Type', content_type)
-            self.send_header('Content-Length', str(len(data)))
-            self.end_headers()
-            self.wfile.write(data)
-        except Exception:
-            return self.send_error(500)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(png)))
+        # The id is never reused, so the image can be cached for its lifetime.
+        self.send_header('Cache-Control', f'private, max-age={int(CAPTCHA_TTL)}, immutable')
+        self.send_header('X-Content-Type-Options', 'nosniff')
+        self.end_headers()
+        self.wfile.write(png)
 
     def current_user(self):
         cookie = parse_cookies(self)
@@ -132,22 +501,14 @@ class Handler(BaseHTTPRequestHandler):
         )
         return send_html(self, 200, body)
 
+    @cached_page('register.html', hole='captcha_id')
     def show_register(self):
-        # Generate a new CAPTCHA
-        captcha_id, img_bytes = generate_captcha()
-        img_b64 = base64.b64encode(img_bytes).decode('ascii')
-
-        nav = _nav_context(None)
-        body = render(
-            'register.html',
-            captcha_id=captcha_id,
-            captcha_image=img_b64,
-            **nav
-        )
-        return send_html(self, 200, body)
+        # Generate a new CAPTCHA; the image itself is served from /captcha/
+        captcha_id, _ = generate_captcha()
+        return dict(_nav_context(None), captcha_id=captcha_id)
 
     def handle_register(self):
-        form = parse_form(self)
+        form = self.read_form()
 
         # CAPTCHA validation
         captcha_id   = form.get('captcha_id',   [''])[0]
@@ -167,55 +528,57 @@ class Handler(BaseHTTPRequestHandler):
         if not is_strong_password(password):
             return send_html(self, 400, b'Weak password')
 
+        # Turn away duplicates before spending a rate-limit token and PBKDF2.
+        if availability.taken('username', username):
+            return send_html(self, 400, b'Username already taken')
+        if availability.taken('email', email):
+            return send_html(self, 400, b'Email already registered')
+
+        wait = _limiter.check(client_ip(self))
+        if wait:
+            return self.send_too_many(wait)
+
         pwd_hash = hash_password(password)
 
-        conn = get_connection()
-        cur  = conn.cursor()
         try:
-            cur.execute(
-                "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)",
-                (username, email, pwd_hash)
-            )
-            conn.commit()
-            return send_redirect(self, '/login')
+            storage.create_user(username, email, pwd_hash)
+        except storage.integrity_errors():
+            return send_html(self, 400, b'Username or email already taken')
         except Exception:
-            conn.rollback()
             return send_html(self, 400, b'Registration failed')
-        finally:
-            cur.close()
-            conn.close()
+        on_commit(lambda: availability.add(username=username, email=email))
+        return send_redirect(self, '/login')
 
+    @cached_page('login.html')
     def show_login(self):
-        nav = _nav_context(None)
-        body = render('login.html', **nav)
-        return send_html(self, 200, body)
+        return _nav_context(None)
 
     def handle_login(self):
-        form     = parse_form(self)
+        form     = self.read_form()
         email    = form.get('email',    [''])[0].strip()
         password = form.get('password', [''])[0]
 
-        conn = get_connection()
-        cur  = conn.cursor(dictionary=True)
+        wait = _limiter.check(client_ip(self), email)
+        if wait:
+            return self.send_too_many(wait)
+
         try:
-            cur.execute(
-                "SELECT id, password_hash FROM users WHERE email = %s",
-                (email,)
-            )
-            row = cur.fetchone()
+            row = storage.get_login(email)
+            self.release_db()
             if row and check_password(row['password_hash'], password):
+                upgrade_password_hash(row['id'], row['password_hash'], password)
                 session_id = create_session(row['id'])
                 self.send_response(302)
                 set_cookie(self, 'session_id', session_id, max_age=86400)
                 self.send_header('Location', '/')
+                self.send_header('Content-Length', '0')
                 self.end_headers()
             else:
                 return send_html(self, 401, b'Invalid credentials')
+        except HashingUnavailable:
+            raise
         except Exception:
             return send_html(self, 500, b'Login failed')
-        finally:
-            cur.close()
-            conn.close()
 
     def show_account(self):
         user = self.current_user()
@@ -230,25 +593,29 @@ class Handler(BaseHTTPRequestHandler):
         user = self.current_user()
         if not user:
             return send_redirect(self, '/login')
+        # Not held idle through the body read or PBKDF2.
+        self.release_db()
 
-        form             = parse_form(self)
+        form             = self.read_form()
         action           = form.get('action',           [''])[0]
         current_password = form.get('current_password', [''])[0]
 
+        wait = _limiter.check(client_ip(self), user['email'])
+        if wait:
+            return self.send_too_many(wait)
         if not check_password(user['password_hash'], current_password):
             return send_html(self, 400, b'Invalid current password')
 
-        conn = get_connection()
-        cur  = conn.cursor()
         try:
             if action == 'nickname':
                 new_nick = form.get('new_nickname', [''])[0].strip()
                 if not is_valid_nickname(new_nick):
                     return send_html(self, 400, b'Invalid nickname')
-                cur.execute(
-                    "UPDATE users SET username=%s, updated_at=NOW() WHERE id=%s",
-                    (new_nick, user['id'])
-                )
+                try:
+                    storage.update_username(user['id'], new_nick)
+                except storage.integrity_errors():
+                    return send_html(self, 400, b'Nickname taken')
+                on_commit(lambda: availability.add(username=new_nick))
 
             elif action == 'password':
                 new_pwd = form.get('new_password',     [''])[0]
@@ -258,22 +625,18 @@ class Handler(BaseHTTPRequestHandler):
                 if not is_strong_password(new_pwd):
                     return send_html(self, 400, b'Weak password')
                 new_hash = hash_password(new_pwd)
-                cur.execute(
-                    "UPDATE users SET password_hash=%s, updated_at=NOW() WHERE id=%s",
-                    (new_hash, user['id'])
-                )
+                storage.update_password_hash(user['id'], new_hash)
 
             else:
                 return send_html(self, 400, b'Unknown action')
 
-            conn.commit()
+            # Run by send_response once the change has committed.
+            on_commit(lambda: invalidate_user(user['id']))
             return send_redirect(self, '/account')
+        except HashingUnavailable:
+            raise
         except Exception:
-            conn.rollback()
             return send_html(self, 500, b'Update failed')
-        finally:
-            cur.close()
-            conn.close()
 
     def show_profile(self):
         user = self.current_user()
@@ -301,30 +664,97 @@ class Handler(BaseHTTPRequestHandler):
         cookie = parse_cookies(self)
         morsel = cookie.get('session_id')
         if morsel:
-            conn = get_connection()
-            cur  = conn.cursor()
-            try:
-                cur.execute(
-                    "DELETE FROM sessions WHERE session_id = %s",
-                    (morsel.value,)
-                )
-                conn.commit()
-            finally:
-                cur.close()
-                conn.close()
+            end_session(morsel.value)
 
         self.send_response(302)
         set_cookie(self, 'session_id', '', max_age=0)
         self.send_header('Location', '/login')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
 
-def run():
-    port = int(os.getenv('PORT', 8000))
-    server = HTTPServer(('0.0.0.0', port), Handler)
+def run(mode=None, workers=None, threads=None, port=None):
+    """
+    Start the server. Each setting falls back to the environment:
+      SERVER_MODE      single | threaded | prefork | async (default: threaded)
+      SERVER_WORKERS   worker processes in prefork mode (default: CPU count)
+      SERVER_THREADS   pool threads per process, 0 = one request at a time;
+                       in async mode, the executor running handler code
+      SERVER_REUSE_PORT  1 = each prefork worker binds with SO_REUSEPORT
+      PORT             listening port (default: 8000)
+    With SESSION_REAPER_INTERVAL set, one process also reaps expired sessions.
+    The availability filters are built once before serving and, with
+    AVAILABILITY_REBUILD_INTERVAL set, rebuilt in every process.
+    """
+    mode    = mode or os.getenv('SERVER_MODE', 'threaded')
+    port    = int(port or os.getenv('PORT', 8000))
+    workers = int(workers or os.getenv('SERVER_WORKERS', 0) or os.cpu_count() or 1)
+    if threads is None:
+        threads = int(os.getenv('SERVER_THREADS', 16))
+    reuse_port = os.getenv('SERVER_REUSE_PORT', '0') == '1'
+
+    if mode not in MODES:
+        raise ValueError(f"Unknown server mode: {mode}")
+    if mode == 'single':
+        threads = 0
+    if mode == 'prefork':
+        global _limiter
+        # A challenge is shown by one worker and answered on another, and
+        # a client's attempts are spread across all of them.
+        share_captcha_store()
+        _limiter = make_limiter(shared=True)
+        share_cores(workers)
+
+    # Render the anonymous pages before the first visitor asks for them.
+    get_page('login.html', _nav_context(None))
+    get_page('register.html', _nav_context(None), hole='captcha_id')
+
+    # Built before forking so prefork workers start with a copy.
+    try:
+        started = time.monotonic()
+        indexed = availability.build()
+        print(f"Availability filters: {indexed} users "
+              f"in {time.monotonic() - started:.2f}s")
+    except Exception as err:
+        print(f"Availability filters not built, checking the DB: {err}")
+
+    def start_background(slot=0):
+        # Only one process per host needs to reap sessions.
+        if slot == 0 and SESSION_REAPER_INTERVAL > 0 and SESSION_MODE == 'db':
+            start_reaper()
+        # Each process holds its own filters, so each keeps them fresh.
+        if AVAILABILITY_REBUILD_INTERVAL > 0:
+            start_rebuilder()
+
+    address = ('0.0.0.0', port)
+    if mode == 'async':
+        print(f"Server listening on http://0.0.0.0:{port} (asyncio)")
+        start_background()
+        serve_async(address, Handler, threads=threads or 1)
+        return
+    if mode == 'prefork':
+        print(f"Server listening on http://0.0.0.0:{port} "
+              f"({workers} workers x {threads or 1} threads)")
+        serve_prefork(address, Handler, workers, threads=threads,
+                      reuse_port=reuse_port, on_worker_start=start_background)
+        return
+
+    start_background()
+    server = make_server(address, Handler, threads=threads)
     print(f"Server listening on http://0.0.0.0:{port}")
-    server.serve_forever()
+    serve(server)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Registration App server')
+    parser.add_argument('--mode', choices=MODES)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--threads', type=int)
+    parser.add_argument('--port', type=int)
+    args = parser.parse_args(argv)
+    run(mode=args.mode, workers=args.workers, threads=args.threads,
+        port=args.port)
 
 
 if __name__ == '__main__':
-    run()
+    main()
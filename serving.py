@@ -0,0 +1,271 @@
+# serving.py
+
+import os
+import sys
+import time
+import select
+import signal
+import socket
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer
+
+MODES = ('single', 'threaded', 'prefork', 'async')
+
+IDLE_SLICE = 0.25   # seconds between saturation checks on an idle connection
+
+# A prefork worker that dies within RESPAWN_QUICK_EXIT seconds of starting
+# is respawned after a doubling delay; after RESPAWN_MAX_FAILURES such
+# exits in a row its slot is given up.
+RESPAWN_QUICK_EXIT   = 5.0
+RESPAWN_BACKOFF      = 0.5
+RESPAWN_BACKOFF_MAX  = 30.0
+RESPAWN_MAX_FAILURES = 5
+
+
+class KeepAliveMixin:
+    """
+    For BaseHTTPRequestHandler subclasses: wait for each request line in
+    IDLE_SLICE steps instead of one blocking read, and give up the
+    connection (and its pool thread) once the server is saturated or the
+    handler's timeout passes with nothing sent.
+    """
+
+    def handle(self):
+        self.close_connection = True
+        while self._await_request():
+            self.handle_one_request()
+            if self.close_connection:
+                break
+
+    def _await_request(self) -> bool:
+        conn     = self.connection
+        server   = self.server
+        deadline = time.monotonic() + (self.timeout or float('inf'))
+        readable = False
+        while True:
+            # Non-blocking peek: pipelined bytes may already be buffered.
+            conn.setblocking(False)
+            try:
+                pending = self.rfile.peek(1)
+            except OSError:
+                return False
+            finally:
+                conn.settimeout(self.timeout)
+            if pending:
+                return True
+            if readable:
+                return False   # readable but empty: the client hung up
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (hasattr(server, 'saturated') and server.saturated()):
+                return False
+            readable = bool(select.select([conn], [], [],
+                                          min(IDLE_SLICE, remaining))[0])
+
+
+class PooledHTTPServer(HTTPServer):
+    """
+    HTTPServer that hands accepted connections to a bounded thread pool.
+    At most threads + queue_size connections are admitted at once; past that
+    the accept loop blocks and new clients wait in the kernel backlog.
+    """
+    allow_reuse_address = True
+    keep_alive = True
+
+    def __init__(self, server_address, handler_class, threads=16,
+                 queue_size=64, reuse_port=False, bind_and_activate=True):
+        self.reuse_port = reuse_port
+        self.threads    = threads
+        self._pool  = ThreadPoolExecutor(max_workers=threads,
+                                         thread_name_prefix='http-worker')
+        self._slots = threading.BoundedSemaphore(threads + queue_size)
+        self._admitted = 0
+        self._lock     = threading.Lock()
+        super().__init__(server_address, handler_class, bind_and_activate)
+
+    def saturated(self) -> bool:
+        """True when admitted connections are waiting for a free thread."""
+        return self._admitted > self.threads
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        with self._lock:
+            self._admitted += 1
+        try:
+            self._pool.submit(self._process, request, client_address)
+        except RuntimeError:
+            # Pool already shut down: drop the connection.
+            self._release()
+            self.shutdown_request(request)
+
+    def _release(self):
+        with self._lock:
+            self._admitted -= 1
+        self._slots.release()
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._release()
+
+    def server_close(self):
+        # Stop accepting, then let in-flight requests finish.
+        super().server_close()
+        self._pool.shutdown(wait=True)
+
+
+class SingleHTTPServer(HTTPServer):
+    """
+    Plain one-request-at-a-time server, optionally bound with SO_REUSEPORT.
+    An idle keep-alive client would lock everyone else out, so handlers
+    close the connection after each response (keep_alive = False).
+    """
+    allow_reuse_address = True
+    keep_alive = False
+
+    def __init__(self, server_address, handler_class, reuse_port=False,
+                 bind_and_activate=True):
+        self.reuse_port = reuse_port
+        super().__init__(server_address, handler_class, bind_and_activate)
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+def make_server(address, handler_class, threads=0, reuse_port=False):
+    """Build a pooled server when threads > 0, else a single-threaded one."""
+    if threads > 0:
+        return PooledHTTPServer(address, handler_class, threads=threads,
+                                queue_size=threads * 4, reuse_port=reuse_port)
+    return SingleHTTPServer(address, handler_class, reuse_port=reuse_port)
+
+
+def _in_main_thread():
+    return threading.current_thread() is threading.main_thread()
+
+
+def _install_stop_handlers(callback):
+    # Signal handlers can only be installed from the main thread.
+    if not _in_main_thread():
+        return
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: callback())
+
+
+def serve(server):
+    """
+    Run server until SIGTERM/SIGINT, then drain in-flight requests.
+    shutdown() must be called from another thread than serve_forever().
+    """
+    _install_stop_handlers(
+        lambda: threading.Thread(target=server.shutdown, daemon=True).start()
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def serve_prefork(address, handler_class, workers, threads=0,
+                  reuse_port=False, on_worker_start=None):
+    """
+    Fork `workers` processes serving the same port. Without reuse_port the
+    parent binds one listening socket that every worker inherits; with it,
+    each worker binds its own socket and the kernel balances between them.
+    Dead workers are respawned, with backoff for ones that keep failing at
+    startup; SIGTERM/SIGINT is forwarded to all workers and the parent
+    waits for them to drain.
+    """
+    shared = None
+    if not reuse_port:
+        shared = make_server(address, handler_class, threads=threads)
+
+    children = {}   # pid -> (slot, started)
+    failures = {}   # slot -> quick exits in a row
+    stopping = threading.Event()
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                for sig in (signal.SIGTERM, signal.SIGINT):
+                    signal.signal(sig, signal.SIG_DFL)
+                server = shared or make_server(address, handler_class,
+                                               threads=threads, reuse_port=True)
+                if on_worker_start:
+                    on_worker_start(slot)
+                serve(server)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        children[pid] = (slot, time.monotonic())
+
+    def respawn(pid, slot, started):
+        if time.monotonic() - started >= RESPAWN_QUICK_EXIT:
+            failures[slot] = 0
+            print(f"Worker {pid} exited, respawning")
+            return spawn(slot)
+
+        failures[slot] = failures.get(slot, 0) + 1
+        if failures[slot] >= RESPAWN_MAX_FAILURES:
+            print(f"Worker {pid} failed {failures[slot]} times on startup, "
+                  f"giving up on slot {slot}")
+            return
+        delay = min(RESPAWN_BACKOFF * 2 ** (failures[slot] - 1), RESPAWN_BACKOFF_MAX)
+        print(f"Worker {pid} exited on startup, respawning in {delay:.1f}s")
+        if not stopping.wait(delay):
+            spawn(slot)
+
+    def stop():
+        stopping.set()
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for slot in range(workers):
+        spawn(slot)
+    _install_stop_handlers(stop)
+
+    try:
+        while children:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            entry = children.pop(pid, None)
+            if entry is not None and not stopping.is_set():
+                respawn(pid, *entry)
+    except KeyboardInterrupt:
+        stop()
+        while children:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            children.pop(pid, None)
+    finally:
+        if shared:
+            shared.socket.close()
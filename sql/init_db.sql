@@ -12,6 +12,7 @@ CREATE TABLE IF NOT EXISTS users (
   created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
   updated_at DATETIME NULL ON UPDATE CURRENT_TIMESTAMP,
   is_active TINYINT(1) NOT NULL DEFAULT 1,
+  session_version INT NOT NULL DEFAULT 0,
   PRIMARY KEY (id)
 ) ENGINE=InnoDB;
 
@@ -22,6 +23,7 @@ CREATE TABLE IF NOT EXISTS sessions (
   created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
   PRIMARY KEY (session_id),
   INDEX idx_sessions_user (user_id),
+  INDEX idx_sessions_expires (expires),
   FOREIGN KEY (user_id)
     REFERENCES users(id)
     ON DELETE CASCADE
@@ -0,0 +1,23 @@
+-- Schema for DB_BACKEND=sqlite; applied on the first connection.
+-- Mirrors init_db.sql. ascii_general_ci comparisons become COLLATE NOCASE.
+
+CREATE TABLE IF NOT EXISTS users (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  username VARCHAR(50) NOT NULL UNIQUE COLLATE NOCASE,
+  email VARCHAR(100) NOT NULL UNIQUE COLLATE NOCASE,
+  password_hash BLOB NOT NULL,
+  created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  updated_at DATETIME NULL,
+  is_active TINYINT NOT NULL DEFAULT 1,
+  session_version INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS sessions (
+  session_id CHAR(64) NOT NULL PRIMARY KEY,
+  user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  expires DATETIME NOT NULL,
+  created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires);
@@ -0,0 +1,4 @@
+-- Per-user key version for SESSION_MODE=token. Bumping it revokes every
+-- token issued to that user.
+ALTER TABLE users
+  ADD COLUMN session_version INT NOT NULL DEFAULT 0 AFTER is_active;
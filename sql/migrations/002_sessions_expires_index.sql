@@ -0,0 +1,3 @@
+-- Lets the session reaper and the expires > NOW() lookups use an index.
+ALTER TABLE sessions
+  ADD INDEX idx_sessions_expires (expires);
@@ -0,0 +1,31 @@
+# sqlite_local.py
+#
+# Connections to the small SQLite files that worker processes on one host
+# share (CAPTCHA store, rate-limit buckets).
+
+import os
+import sqlite3
+import threading
+
+
+class LocalConnections:
+    """
+    One autocommit WAL connection to `path` per thread and per process;
+    a connection is never reused across fork().
+    """
+
+    def __init__(self, path, timeout=5):
+        self.path    = path
+        self.timeout = timeout
+        self._local  = threading.local()
+
+    def get(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid  = os.getpid()
+        return conn
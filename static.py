@@ -0,0 +1,205 @@
+# static.py
+
+import os
+import re
+import socket
+import threading
+import email.utils
+import urllib.parse
+from collections import OrderedDict
+
+from metrics import phase
+
+MIME_TYPES = {
+    '.css':   'text/css; charset=utf-8',
+    '.js':    'application/javascript; charset=utf-8',
+    '.mjs':   'application/javascript; charset=utf-8',
+    '.json':  'application/json',
+    '.map':   'application/json',
+    '.html':  'text/html; charset=utf-8',
+    '.txt':   'text/plain; charset=utf-8',
+    '.svg':   'image/svg+xml',
+    '.png':   'image/png',
+    '.jpg':   'image/jpeg',
+    '.jpeg':  'image/jpeg',
+    '.gif':   'image/gif',
+    '.webp':  'image/webp',
+    '.avif':  'image/avif',
+    '.ico':   'image/x-icon',
+    '.woff':  'font/woff',
+    '.woff2': 'font/woff2',
+    '.ttf':   'font/ttf',
+    '.otf':   'font/otf',
+    '.wasm':  'application/wasm',
+    '.pdf':   'application/pdf',
+}
+DEFAULT_MIME = 'application/octet-stream'
+
+STATIC_MAX_AGE        = int(os.getenv('STATIC_MAX_AGE', 3600))
+STATIC_CACHE_ENTRIES  = int(os.getenv('STATIC_CACHE_ENTRIES', 256))
+STATIC_CACHE_MAX_FILE = int(os.getenv('STATIC_CACHE_MAX_FILE', 64 * 1024))
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Small files kept in memory: path -> ((mtime_ns, size), data)
+_small_files = OrderedDict()
+_small_lock  = threading.Lock()
+
+
+def _read_small(path, st):
+    key = (st.st_mtime_ns, st.st_size)
+    with _small_lock:
+        entry = _small_files.get(path)
+        if entry is not None and entry[0] == key:
+            _small_files.move_to_end(path)
+            return entry[1]
+    with open(path, 'rb') as f:
+        data = f.read()
+    with _small_lock:
+        _small_files[path] = (key, data)
+        while len(_small_files) > STATIC_CACHE_ENTRIES:
+            _small_files.popitem(last=False)
+    return data
+
+
+def _resolve(root, rel_path):
+    """Map a URL path below /static/ to a file, refusing anything outside root."""
+    rel_path = urllib.parse.unquote(rel_path.split('?', 1)[0].split('#', 1)[0])
+    if '\x00' in rel_path:
+        # %00 decodes to a byte no filesystem path can hold.
+        return None
+    root = os.path.realpath(root)
+    full = os.path.realpath(os.path.join(root, rel_path.lstrip('/')))
+    if not full.startswith(root + os.sep) or not os.path.isfile(full):
+        return None
+    return full
+
+
+def _not_modified(headers, etag, mtime):
+    inm = headers.get('If-None-Match')
+    if inm is not None:
+        tags = [t.strip() for t in inm.split(',')]
+        return '*' in tags or etag in tags or f'W/{etag}' in tags
+    ims = headers.get('If-Modified-Since')
+    if ims:
+        try:
+            since = email.utils.parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+
+def _parse_range(value, size):
+    """
+    Return (start, end) inclusive for a single "bytes=" range, None when the
+    header should be ignored, or False when it cannot be satisfied.
+    """
+    m = _RANGE_RE.match(value.strip())
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    first, last = m.group(1), m.group(2)
+    if not first:
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end   = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _write_file(handler, path, offset, count):
+    conn = getattr(handler, 'connection', None)
+    with open(path, 'rb') as f:
+        if isinstance(conn, socket.socket):
+            with phase('write'):
+                conn.sendfile(f, offset, count)
+            return
+        f.seek(offset)
+        while count > 0:
+            chunk = f.read(min(count, 256 * 1024))
+            if not chunk:
+                break
+            handler.wfile.write(chunk)
+            count -= len(chunk)
+
+
+def serve_file(handler, root, rel_path):
+    """
+    Serve a file below root with validators, conditional GETs, single byte
+    ranges and precompressed .gz siblings. Small files come from an
+    in-memory cache; larger ones are streamed with sendfile().
+    """
+    path = _resolve(root, rel_path)
+    if path is None:
+        return handler.send_error(404)
+
+    content_type = MIME_TYPES.get(os.path.splitext(path)[1].lower(), DEFAULT_MIME)
+    headers  = handler.headers
+    has_gzip = os.path.isfile(path + '.gz')
+    encoding = None
+    range_header = headers.get('Range')
+    if (has_gzip and not range_header
+            and 'gzip' in headers.get('Accept-Encoding', '').lower()):
+        path, encoding = path + '.gz', 'gzip'
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return handler.send_error(404)
+    size  = st.st_size
+    etag  = f'"{st.st_mtime_ns:x}-{size:x}{"-gz" if encoding else ""}"'
+    last_modified = email.utils.formatdate(st.st_mtime, usegmt=True)
+
+    def common_headers():
+        handler.send_header('ETag', etag)
+        handler.send_header('Last-Modified', last_modified)
+        handler.send_header('Cache-Control', f'public, max-age={STATIC_MAX_AGE}')
+        handler.send_header('Accept-Ranges', 'bytes')
+        if has_gzip:
+            handler.send_header('Vary', 'Accept-Encoding')
+
+    if _not_modified(headers, etag, st.st_mtime):
+        handler.send_response(304)
+        common_headers()
+        handler.end_headers()
+        return
+
+    start, end, status = 0, size - 1, 200
+    if range_header and headers.get('If-Range', etag) == etag:
+        span = _parse_range(range_header, size)
+        if span is False:
+            handler.send_response(416)
+            handler.send_header('Content-Range', f'bytes */{size}')
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return
+        if span is not None:
+            (start, end), status = span, 206
+
+    count = end - start + 1 if size else 0
+    try:
+        data = _read_small(path, st) if size <= STATIC_CACHE_MAX_FILE else None
+    except OSError:
+        return handler.send_error(500)
+
+    try:
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(count))
+        if encoding:
+            handler.send_header('Content-Encoding', encoding)
+        if status == 206:
+            handler.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        common_headers()
+        handler.end_headers()
+        if data is not None:
+            handler.wfile.write(data[start:end + 1] if status == 206 else data)
+        elif count:
+            _write_file(handler, path, start, count)
+    except OSError:
+        # Client went away mid-transfer; nothing useful left to send.
+        handler.close_connection = True
@@ -0,0 +1,147 @@
+# storage.py
+#
+# Every users/sessions query the app runs. Statements are written once in
+# MySQL dialect and translated by db.backend (cached per statement), so
+# callers never see which engine is behind the pool. Inside a request they
+# all share the request's connection and transaction (db.request_scope).
+
+import db
+
+# Deleting through the expires index in bounded batches. SQLite has no
+# DELETE ... ORDER BY ... LIMIT, and MySQL refuses LIMIT inside IN (...).
+_REAP_SQL = {
+    'mysql':  "DELETE FROM sessions WHERE expires <= NOW() "
+              "ORDER BY expires LIMIT %s",
+    'sqlite': "DELETE FROM sessions WHERE session_id IN "
+              "(SELECT session_id FROM sessions WHERE expires <= NOW() "
+              "ORDER BY expires LIMIT %s)",
+}
+
+
+def integrity_errors():
+    """Exception types raised for duplicate keys by the active backend."""
+    return db.backend.integrity_errors
+
+
+def _row(cur):
+    # fetchall() drains the result so the shared connection stays usable.
+    rows = cur.fetchall()
+    if not rows:
+        return None
+    return dict(zip([col[0] for col in cur.description], rows[0]))
+
+
+def _query_one(sql, params):
+    with db.unit_of_work() as uow, uow.cursor() as cur:
+        cur.execute(sql, params)
+        return _row(cur)
+
+
+def _execute(sql, params) -> int:
+    with db.unit_of_work() as uow, uow.cursor() as cur:
+        cur.execute(sql, params)
+        return cur.rowcount
+
+
+# ---- users ----------------------------------------------------------------
+
+_INSERT_USER = ("INSERT INTO users (username, email, password_hash) "
+                "VALUES (%s, %s, %s)")
+
+def create_user(username, email, password_hash) -> int:
+    with db.unit_of_work() as uow, uow.cursor() as cur:
+        cur.execute(_INSERT_USER, (username, email, password_hash))
+        return cur.lastrowid
+
+def create_users(rows) -> list:
+    """
+    Insert (username, email, password_hash) rows in one transaction.
+    Rows that collide with an existing user are skipped; returns their
+    indexes in `rows`.
+    """
+    with db.unit_of_work() as uow, uow.cursor() as cur:
+        try:
+            cur.executemany(_INSERT_USER, rows)
+            return []
+        except integrity_errors():
+            uow.rollback()
+
+        # Some row collides: retry one by one so only those are skipped.
+        skipped = []
+        for index, row in enumerate(rows):
+            try:
+                cur.execute(_INSERT_USER, row)
+            except integrity_errors():
+                skipped.append(index)
+        return skipped
+
+def get_user(user_id):
+    return _query_one("SELECT * FROM users WHERE id = %s", (user_id,))
+
+def get_login(email):
+    """id and password_hash of the account with this email, or None."""
+    return _query_one("SELECT id, password_hash FROM users WHERE email = %s",
+                      (email,))
+
+def username_taken(username) -> bool:
+    return _query_one("SELECT 1 AS taken FROM users WHERE username = %s",
+                      (username,)) is not None
+
+def email_taken(email) -> bool:
+    return _query_one("SELECT 1 AS taken FROM users WHERE email = %s",
+                      (email,)) is not None
+
+def iter_identities(batch_size=5000):
+    """
+    Yield (username, email) of every user, walking the primary key in
+    batches so no single query holds a long read or a large result set.
+    """
+    last_id = 0
+    while True:
+        with db.unit_of_work() as uow, uow.cursor() as cur:
+            cur.execute("SELECT id, username, email FROM users WHERE id > %s "
+                        "ORDER BY id LIMIT %s", (last_id, batch_size))
+            rows = cur.fetchall()
+        for _, username, email in rows:
+            yield username, email
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1][0]
+
+def update_username(user_id, username):
+    _execute("UPDATE users SET username=%s, updated_at=NOW() WHERE id=%s",
+             (username, user_id))
+
+def update_password_hash(user_id, password_hash):
+    _execute("UPDATE users SET password_hash=%s, updated_at=NOW() WHERE id=%s",
+             (password_hash, user_id))
+
+def bump_session_version(user_id):
+    _execute("UPDATE users SET session_version = session_version + 1, "
+             "updated_at = updated_at WHERE id = %s", (user_id,))
+
+def delete_users_like(email_pattern) -> int:
+    return _execute("DELETE FROM users WHERE email LIKE %s", (email_pattern,))
+
+
+# ---- sessions -------------------------------------------------------------
+
+def create_session(session_id, user_id, expires):
+    _execute("INSERT INTO sessions (session_id, user_id, expires) "
+             "VALUES (%s, %s, %s)", (session_id, user_id, expires))
+
+def get_session_user(session_id):
+    """The user row of a live session, plus its `session_expires`."""
+    return _query_one(
+        "SELECT u.*, s.expires AS session_expires FROM sessions s "
+        "JOIN users u ON u.id = s.user_id "
+        "WHERE s.session_id = %s AND s.expires > NOW()",
+        (session_id,)
+    )
+
+def delete_session(session_id):
+    _execute("DELETE FROM sessions WHERE session_id = %s", (session_id,))
+
+def delete_expired_sessions(limit) -> int:
+    """Delete up to `limit` expired sessions, oldest first."""
+    return _execute(_REAP_SQL[db.backend.name], (limit,))
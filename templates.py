@@ -1,8 +1,17 @@
 # templates.py
 
 import os
+import string
 
-TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+from metrics import phase
+
+TEMPLATE_DIR    = os.path.join(os.path.dirname(__file__), 'templates')
+BASE_TEMPLATE   = 'base.html'
+# Re-read templates whose files changed on disk (development only).
+TEMPLATE_RELOAD = os.getenv('TEMPLATE_RELOAD', '0') == '1'
+
+_formatter = string.Formatter()
+_compiled  = {}
 
 def _load_raw(name: str) -> str:
     path = os.path.join(TEMPLATE_DIR, name)
@@ -12,22 +21,117 @@ def _load_raw(name: str) -> str:
     except FileNotFoundError:
         raise RuntimeError(f"Template not found: {name}")
 
-def render(template_name: str, **context) -> bytes:
-
-    raw_child = _load_raw(template_name)
+def _mtime(name: str) -> int:
     try:
-        child_html = raw_child.format(**context)
-    except KeyError as e:
-        raise RuntimeError(f"Missing template variable: {e.args[0]} in {template_name}")
+        return os.stat(os.path.join(TEMPLATE_DIR, name)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
 
-    raw_base = _load_raw('base.html')
 
-    full_context = dict(context)
-    full_context['content'] = child_html
+class _Field:
+    """A replacement field of a compiled template."""
+    __slots__ = ('name', 'simple', 'spec', 'conversion')
 
-    try:
-        final_html = raw_base.format(**full_context)
-    except KeyError as e:
-        raise RuntimeError(f"Missing template variable: {e.args[0]} in base.html")
+    def __init__(self, name, spec, conversion):
+        self.name       = name
+        self.simple     = '.' not in name and '[' not in name
+        self.spec       = spec
+        self.conversion = conversion
+
+    def value(self, context):
+        if self.simple:
+            value = context[self.name]
+        else:
+            value = _formatter.get_field(self.name, (), context)[0]
+        if self.conversion:
+            value = _formatter.convert_field(value, self.conversion)
+        spec = self.spec
+        if '{' in spec:
+            spec = _formatter.vformat(spec, (), context)
+        if spec or value.__class__ is not str:
+            value = format(value, spec)
+        return value
+
+
+def _parse(raw: str) -> list:
+    segments = []
+    for literal, name, spec, conversion in _formatter.parse(raw):
+        if literal:
+            segments.append(literal)
+        if name is not None:
+            segments.append(_Field(name, spec or '', conversion))
+    return segments
+
+def _merge(segments: list) -> list:
+    """Coalesce adjacent literals and pre-encode them."""
+    merged, text = [], []
+    for seg in segments:
+        if isinstance(seg, str):
+            text.append(seg)
+            continue
+        if text:
+            merged.append(''.join(text).encode('utf-8'))
+            text = []
+        merged.append(seg)
+    if text:
+        merged.append(''.join(text).encode('utf-8'))
+    return merged
 
-    return final_html.encode('utf-8')
+
+class _Template:
+    """
+    A child template spliced into base.html at {content}, compiled once
+    into a flat list of byte literals and replacement fields.
+    """
+
+    def __init__(self, name):
+        self.name   = name
+        self.mtimes = (_mtime(name), _mtime(BASE_TEMPLATE))
+
+        child = _parse(_load_raw(name))
+        base  = _parse(_load_raw(BASE_TEMPLATE))
+        segments = []
+        for seg in base:
+            if (isinstance(seg, _Field) and seg.name == 'content'
+                    and not seg.spec and not seg.conversion):
+                segments.extend(child)
+            else:
+                segments.append(seg)
+
+        self.segments = _merge(segments)
+        self.child_fields = list(dict.fromkeys(
+            s.name.partition('.')[0].partition('[')[0]
+            for s in child if isinstance(s, _Field)))
+
+    def stale(self) -> bool:
+        return self.mtimes != (_mtime(self.name), _mtime(BASE_TEMPLATE))
+
+    def render(self, context) -> bytes:
+        out = []
+        append = out.append
+        try:
+            for seg in self.segments:
+                if seg.__class__ is bytes:
+                    append(seg)
+                else:
+                    append(seg.value(context).encode('utf-8'))
+        except KeyError as e:
+            # Report child variables first, as the two-pass renderer did.
+            missing = [f for f in self.child_fields if f not in context]
+            if missing:
+                raise RuntimeError(
+                    f"Missing template variable: {missing[0]} in {self.name}")
+            raise RuntimeError(
+                f"Missing template variable: {e.args[0]} in {BASE_TEMPLATE}")
+        return b''.join(out)
+
+
+def get_template(template_name: str) -> _Template:
+    template = _compiled.get(template_name)
+    if template is None or (TEMPLATE_RELOAD and template.stale()):
+        template = _compiled[template_name] = _Template(template_name)
+    return template
+
+def render(template_name: str, **context) -> bytes:
+    with phase('render'):
+        return get_template(template_name).render(context)
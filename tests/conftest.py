@@ -0,0 +1,14 @@
+import pytest
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    # Imported here so modules that never touch the database collect
+    # without DB_* settings.
+    import db
+    from backends import SQLiteBackend
+
+    backend = SQLiteBackend(str(tmp_path / 'app.db'))
+    monkeypatch.setattr(db, 'backend', backend)
+    monkeypatch.setattr(db, '_pool', db.ConnectionPool(backend.connect,
+                                                       ping=backend.ping))
+    return backend
@@ -0,0 +1,46 @@
+import asyncio
+import threading
+import time
+import http.client
+import pytest
+
+from aioserver import AsyncHTTPServer
+from server import Handler
+
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8003
+
+@pytest.fixture(scope="module", autouse=True)
+def start_server():
+    server = AsyncHTTPServer((SERVER_HOST, SERVER_PORT), Handler, threads=4)
+    thread = threading.Thread(target=asyncio.run, args=(server.serve(),),
+                              daemon=True)
+    thread.start()
+    time.sleep(0.5)
+    yield
+    server.stop()
+    thread.join(timeout=5)
+
+def http_request(method, path, body=None):
+    conn = http.client.HTTPConnection(SERVER_HOST, SERVER_PORT)
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'} if body else {}
+    conn.request(method, path, body=body, headers=headers)
+    resp = conn.getresponse()
+    data = resp.read().decode('utf-8', errors='ignore')
+    conn.close()
+    return resp.status, data
+
+def test_async_engine_serves_login_page():
+    status, body = http_request('GET', '/login')
+    assert status == 200
+    assert '<form' in body and 'name="email"' in body
+
+def test_async_engine_404_for_unknown_path():
+    status, _ = http_request('GET', '/does_not_exist')
+    assert status == 404
+    status, _ = http_request('POST', '/does_not_exist', body='a=b')
+    assert status == 404
+
+def test_async_engine_applies_route_body_limit():
+    status, _ = http_request('POST', '/login', body='password=' + 'x' * 5000)
+    assert status == 413
@@ -1,6 +1,10 @@
 import pytest
 
+import db
+import auth
+import storage
 from auth import hash_password, check_password, create_session, get_user_from_session
+from hashing import pbkdf2, LEGACY_ITERATIONS
 from db import get_connection
 
 @pytest.fixture(scope="module")
@@ -20,6 +24,33 @@ def test_hash_and_check_password():
     assert check_password(h, pw)
     assert not check_password(h, "wrong!")
 
+def test_legacy_hash_still_verifies_and_needs_rehash():
+    salt = b'0123456789abcdef'
+    legacy = salt + pbkdf2(b'Str0ng!Pass', salt, LEGACY_ITERATIONS)
+    assert check_password(legacy, "Str0ng!Pass")
+    assert not check_password(legacy, "wrong!")
+    assert auth.needs_rehash(legacy)
+
+def test_needs_rehash_when_cost_changes(monkeypatch):
+    h = hash_password("Str0ng!Pass")
+    assert not auth.needs_rehash(h)
+    monkeypatch.setattr(auth, 'PBKDF2_ITERATIONS', auth.PBKDF2_ITERATIONS * 2)
+    assert auth.needs_rehash(h)
+    # Still verifies at the cost recorded in the hash.
+    assert check_password(h, "Str0ng!Pass")
+
+def test_failed_rehash_does_not_roll_back_the_request(monkeypatch):
+    def failing_update(user_id, password_hash):
+        with db.unit_of_work():
+            raise RuntimeError("write failed")
+    monkeypatch.setattr(storage, 'update_password_hash', failing_update)
+
+    salt = b'0123456789abcdef'
+    legacy = salt + pbkdf2(b'Str0ng!Pass', salt, LEGACY_ITERATIONS)
+    with db.request_scope() as uow:
+        assert not auth.upgrade_password_hash(1, legacy, "Str0ng!Pass")
+        assert not uow.rollback_only
+
 def test_create_and_retrieve_session(temp_db):
     conn = get_connection()
     cur = conn.cursor()
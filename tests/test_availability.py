@@ -0,0 +1,43 @@
+import storage
+from availability import AvailabilityIndex, BloomFilter
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    items = [f'user{i}'.encode() for i in range(1000)]
+    for item in items:
+        bloom.add(item)
+    assert all(item in bloom for item in items)
+    false_hits = sum(f'other{i}'.encode() in bloom for i in range(10_000))
+    assert false_hits < 300
+
+def test_index_built_from_streaming_scan(sqlite_db):
+    for i in range(7):
+        storage.create_user(f'user{i}', f'user{i}@example.com', b'x')
+    assert [u for u, _ in storage.iter_identities(batch_size=3)] == \
+        [f'user{i}' for i in range(7)]
+
+    index = AvailabilityIndex(capacity=100)
+    # Not built yet: every lookup is answered by the database.
+    assert index.taken('username', 'user1')
+    assert index.build(batch_size=3) == 7
+    assert index.taken('username', 'USER3') and index.taken('email', 'user6@example.com')
+    assert not index.taken('username', 'nobody')
+    assert index.stats()['indexed'] == 7
+
+def test_index_tracks_new_names(sqlite_db):
+    index = AvailabilityIndex(capacity=100)
+    index.build()
+    assert not index.taken('username', 'fresh')
+    storage.create_user('fresh', 'fresh@example.com', b'x')
+    index.add(username='fresh', email='fresh@example.com')
+    assert index.taken('username', 'fresh')
+    assert index.taken('email', 'fresh@example.com')
+    assert index.stats()['filtered'] == 1
+
+def test_exact_lookup_sees_names_the_filter_missed(sqlite_db):
+    index = AvailabilityIndex(capacity=100)
+    index.build()
+    # Registered through another worker: this process's filter never saw it.
+    storage.create_user('elsewhere', 'elsewhere@example.com', b'x')
+    assert not index.taken('username', 'elsewhere')
+    assert index.taken('username', 'elsewhere', exact=True)
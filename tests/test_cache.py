@@ -0,0 +1,40 @@
+import time
+
+from cache import TTLCache
+
+def test_hit_miss_and_stats():
+    cache = TTLCache(maxsize=10, ttl=60)
+    assert cache.get('a') is None
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 1
+    assert stats['hit_rate'] == 0.5
+
+def test_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+def test_entry_ttl_is_capped_and_expires():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('a', 1, ttl=0.01)
+    cache.set('gone', 1, ttl=-5)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert cache.get('gone') is None
+    assert cache.stats()['expirations'] == 1
+
+def test_invalidation():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('s1', {'id': 1})
+    cache.set('s2', {'id': 1})
+    cache.set('s3', {'id': 2})
+    assert cache.pop_where(lambda user: user['id'] == 1) == 2
+    cache.pop('s3')
+    assert len(cache) == 0
@@ -1,6 +1,7 @@
 # tests/test_captcha.py
+import time
 import pytest
-from captcha import generate_captcha, verify_captcha, _CAPTCHA_STORE
+from captcha import generate_captcha, verify_captcha, _CAPTCHA_STORE, CaptchaPool
 
 def test_generate_and_verify_captcha():
     captcha_id, img_bytes = generate_captcha()
@@ -14,3 +15,33 @@ def test_generate_and_verify_captcha():
 
     assert verify_captcha(captcha_id, expected_code)
     assert not verify_captcha(captcha_id, expected_code)
+
+def test_pool_prefills_and_counts_underflows():
+    counter = iter(range(1000))
+    pool = CaptchaPool(depth=4, refill=1, factory=lambda: next(counter))
+    assert pool.pop() is None
+    assert pool.stats()['underflows'] == 1
+
+    deadline = time.monotonic() + 2
+    while pool.stats()['available'] < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [pool.pop() for _ in range(3)] == [0, 1, 2]
+    stats = pool.stats()
+    assert stats['hits'] == 3 and stats['produced'] >= 4
+
+def test_pool_survives_a_failing_factory():
+    calls = []
+    def flaky():
+        calls.append(None)
+        if len(calls) == 1:
+            raise OSError('font missing')
+        return len(calls)
+
+    pool = CaptchaPool(depth=2, refill=0, factory=flaky, retry_delay=0.01)
+    assert pool.pop() is None
+
+    deadline = time.monotonic() + 2
+    while pool.stats()['available'] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pool.stats()['errors'] == 1
+    assert [pool.pop(), pool.pop()] == [2, 3]
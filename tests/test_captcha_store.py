@@ -0,0 +1,66 @@
+import time
+import pytest
+
+from captcha_store import MemoryCaptchaStore, SQLiteCaptchaStore, make_store
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make(request, tmp_path):
+    def factory(**kwargs):
+        if request.param == 'sqlite':
+            return SQLiteCaptchaStore(path=str(tmp_path / 'captcha.db'), **kwargs)
+        return MemoryCaptchaStore(**kwargs)
+    return factory
+
+def test_consume_is_single_use_and_case_insensitive(make):
+    store = make(ttl=60, max_entries=10)
+    store.put('a', 'AB12C')
+    assert store.get('a') == 'AB12C'
+    assert not store.consume('a', 'wrong')
+    assert store.consume('a', 'ab12c')
+    assert not store.consume('a', 'AB12C')
+    assert store.get('a') is None
+
+def test_image_is_kept_with_code(make):
+    store = make(ttl=60, max_entries=10)
+    store.put('a', 'AB12C', b'\x89PNG...')
+    assert store.get_image('a') == b'\x89PNG...'
+    assert store.consume('a', 'AB12C')
+    assert store.get_image('a') is None
+
+def test_entry_cap_must_hold_one(make):
+    with pytest.raises(ValueError):
+        make(ttl=60, max_entries=0)
+    store = make(ttl=60, max_entries=1)
+    store.put('a', 'AAAAA')
+    store.put('b', 'BBBBB')
+    assert store.get('a') is None and store.get('b') == 'BBBBB'
+
+def test_entries_expire(make):
+    store = make(ttl=0.05, max_entries=10)
+    store.put('a', 'CODE1')
+    time.sleep(0.1)
+    assert store.get('a') is None
+    assert not store.consume('a', 'CODE1')
+    store.put('b', 'CODE2')
+    assert len(store) == 1
+
+def test_entry_cap_evicts_oldest(make):
+    store = make(ttl=60, max_entries=3)
+    for i in range(5):
+        store.put(f'id{i}', f'C{i}')
+    assert len(store) == 3
+    assert store.get('id0') is None and store.get('id1') is None
+    assert store.get('id4') == 'C4'
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'shared.db')
+    writer = SQLiteCaptchaStore(path=path, ttl=60)
+    reader = SQLiteCaptchaStore(path=path, ttl=60)
+    writer.put('x', 'ZZZZZ')
+    assert reader.consume('x', 'zzzzz')
+    assert not writer.consume('x', 'zzzzz')
+
+def test_memory_store_is_refused_across_processes():
+    assert isinstance(make_store(kind='auto'), MemoryCaptchaStore)
+    with pytest.raises(RuntimeError):
+        make_store(shared=True, kind='memory')
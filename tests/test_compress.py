@@ -0,0 +1,23 @@
+import gzip
+
+import compress
+from compress import negotiate, CompressedCache
+
+def test_negotiate_honours_q_values():
+    assert negotiate('') is None
+    assert negotiate('gzip, deflate') == 'gzip'
+    assert negotiate('deflate') is None
+    assert negotiate('gzip;q=0') is None
+    assert negotiate('identity;q=1, *;q=0.5') == next(iter(compress.CODECS))
+    assert negotiate('br;q=0.1, GZIP;q=0.9') == 'gzip'
+
+def test_cacheable_bodies_are_compressed_once(monkeypatch):
+    monkeypatch.setattr(compress, '_cache', CompressedCache(max_entries=1))
+    body = b'<p>same page</p>' * 100
+    first = compress.compress(body, 'gzip', cacheable=True)
+    assert compress.compress(body, 'gzip', cacheable=True) is first
+    assert gzip.decompress(first) == body
+    assert compress.cache_stats() == {'hits': 1, 'misses': 1, 'entries': 1}
+
+    compress.compress(b'other' * 200, 'gzip', cacheable=True)
+    assert compress.cache_stats()['entries'] == 1
@@ -0,0 +1,81 @@
+import threading
+import pytest
+
+from db import ConnectionPool, PoolError
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.in_transaction = False
+        self.rolled_back = 0
+        self.alive = True
+
+    def ping(self, reconnect=False):
+        if not self.alive:
+            raise RuntimeError("gone")
+
+    def rollback(self):
+        self.rolled_back += 1
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+def make_pool(**kwargs):
+    created = []
+    def connect():
+        conn = FakeConnection()
+        created.append(conn)
+        return conn
+    return ConnectionPool(connect, **kwargs), created
+
+def test_connections_are_reused():
+    pool, created = make_pool(max_size=2)
+    conn = pool.acquire()
+    conn.close()
+    conn = pool.acquire()
+    conn.close()
+    assert len(created) == 1
+    stats = pool.stats()
+    assert stats['creates'] == 1 and stats['acquires'] == 2
+    assert stats['idle'] == 1 and stats['in_use'] == 0
+
+def test_release_rolls_back_open_transaction():
+    pool, created = make_pool()
+    conn = pool.acquire()
+    created[0].in_transaction = True
+    conn.close()
+    assert created[0].rolled_back == 1
+
+def test_acquire_times_out_when_exhausted():
+    pool, _ = make_pool(max_size=1, timeout=0.05)
+    held = pool.acquire()
+    with pytest.raises(PoolError):
+        pool.acquire()
+    stats = pool.stats()
+    assert stats['waits'] == 1 and stats['timeouts'] == 1
+    held.close()
+
+def test_waiter_gets_released_connection():
+    pool, created = make_pool(max_size=1, timeout=2)
+    held = pool.acquire()
+    got = []
+    t = threading.Thread(target=lambda: got.append(pool.acquire()))
+    t.start()
+    held.close()
+    t.join()
+    assert got and len(created) == 1
+
+def test_dead_and_expired_connections_are_replaced():
+    pool, created = make_pool(ping_after=0, max_lifetime=3600)
+    conn = pool.acquire()
+    conn.close()
+    created[0].alive = False
+    pool.acquire().close()
+    assert len(created) == 2 and created[0].closed
+    assert pool.stats()['ping_failures'] == 1
+
+    pool.max_lifetime = 0
+    pool.acquire().close()
+    assert len(created) == 3
+    assert pool.stats()['evictions'] == 2
@@ -0,0 +1,76 @@
+import io
+import urllib.parse
+import pytest
+
+from forms import FormError, parse_body
+
+def urlencoded(pairs):
+    body = urllib.parse.urlencode(pairs).encode('utf-8')
+    return io.BytesIO(body), {'Content-Length': str(len(body))}
+
+def multipart(parts, boundary='XyZ'):
+    body = b''
+    for headers, data in parts:
+        body += f'--{boundary}\r\n{headers}\r\n\r\n'.encode('latin-1') + data + b'\r\n'
+    body += f'--{boundary}--\r\n'.encode('latin-1')
+    return io.BytesIO(body), {
+        'Content-Length': str(len(body)),
+        'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+class Trickle(io.BytesIO):
+    """Stream handing out one byte per read, like a slow client."""
+    def read1(self, size=-1):
+        return self.read(1)
+
+def test_urlencoded_across_chunk_boundaries():
+    stream, headers = urlencoded([('a', 'x' * 20000), ('a', 'é ok'), ('b', ''), ('c', '1')])
+    form = parse_body(Trickle(stream.getvalue()), headers, max_body=10**6)
+    assert form == {'a': ['x' * 20000, 'é ok'], 'c': ['1']}
+
+def test_limits_refuse_early():
+    stream, headers = urlencoded([('a', 'x' * 100)])
+    with pytest.raises(FormError) as err:
+        parse_body(stream, headers, max_body=50)
+    assert err.value.status == 413 and stream.tell() == 0
+
+    stream, headers = urlencoded([(f'f{i}', 'v') for i in range(5)])
+    with pytest.raises(FormError) as err:
+        parse_body(stream, headers, max_fields=4)
+    assert err.value.status == 413
+
+    with pytest.raises(FormError) as err:
+        parse_body(io.BytesIO(b'a=1'), {'Content-Length': '10'})
+    assert err.value.status == 400
+
+def test_read_deadline():
+    stream, headers = urlencoded([('a', 'x' * 100)])
+    with pytest.raises(FormError) as err:
+        parse_body(Trickle(stream.getvalue()), headers, timeout=-1)
+    assert err.value.status == 408
+
+def test_multipart_fields_and_files():
+    content = bytes(range(256)) * 300
+    stream, headers = multipart([
+        ('Content-Disposition: form-data; name="username"', 'bob'.encode()),
+        ('Content-Disposition: form-data; name="avatar"; filename="a.png"\r\n'
+         'Content-Type: image/png', content),
+    ])
+    form = parse_body(Trickle(stream.getvalue()), headers, max_body=10**6,
+                      allow_files=True)
+    assert form['username'] == ['bob']
+    upload = form['avatar'][0]
+    assert (upload.filename, upload.content_type, upload.size) == \
+        ('a.png', 'image/png', len(content))
+    assert upload.read() == content
+
+    stream, headers = multipart([
+        ('Content-Disposition: form-data; name="avatar"; filename="a.png"', b'x')])
+    with pytest.raises(FormError) as err:
+        parse_body(stream, headers)
+    assert err.value.status == 400
+
+def test_unsupported_content_type():
+    with pytest.raises(FormError) as err:
+        parse_body(io.BytesIO(b'{}'), {'Content-Length': '2',
+                                       'Content-Type': 'application/json'})
+    assert err.value.status == 415
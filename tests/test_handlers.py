@@ -1,6 +1,8 @@
 import threading
 import time
 import os
+import re
+import json
 import http.client
 import pytest
 
@@ -46,6 +48,23 @@ def test_register_page_renders_form():
     assert status == 200
     assert '<form' in body and 'name="username"' in body
 
+def test_captcha_image_served_from_store():
+    _, body, _ = http_get('/register')
+    captcha_id = re.search(r'name="captcha_id" value="([^"]+)"', body).group(1)
+    assert f'/captcha/{captcha_id}.png' in body
+
+    conn = http.client.HTTPConnection(SERVER_HOST, SERVER_PORT)
+    conn.request('GET', f'/captcha/{captcha_id}.png')
+    resp = conn.getresponse()
+    data = resp.read()
+    conn.close()
+    assert resp.status == 200
+    assert resp.getheader('Content-Type') == 'image/png'
+    assert data.startswith(b'\x89PNG')
+
+    status, _, _ = http_get('/captcha/00000000-0000-0000-0000-000000000000.png')
+    assert status == 404
+
 def test_login_page_renders_form():
     status, body, _ = http_get('/login')
     assert status == 200
@@ -62,3 +81,86 @@ def test_home_redirects_to_login_when_not_logged_in():
 def test_static_serving_css():
     status, _, _ = http_get('/static/css/styles.css')
     assert status in (200, 404)
+
+def test_metrics_endpoint_reports_requests():
+    http_get('/login')
+    status, body, _ = http_get('/metrics')
+    assert status == 200
+    assert 'http_requests_total{method="GET",route="/login",status="200"}' in body
+    assert 'http_request_phase_seconds_bucket{route="/login",status="200",phase="write"' in body
+    assert '# TYPE db_pool_connections gauge' in body
+
+def test_keep_alive_reuses_one_connection():
+    conn = http.client.HTTPConnection(SERVER_HOST, SERVER_PORT)
+    conn.request('GET', '/login')
+    resp = conn.getresponse()
+    resp.read()
+    assert resp.version == 11 and resp.getheader('Connection') is None
+    sock = conn.sock
+
+    # Redirects, errors and unread POST bodies all keep the framing intact.
+    conn.request('GET', '/')
+    resp = conn.getresponse()
+    assert resp.status == 302 and resp.read() == b''
+    conn.request('POST', '/nowhere', body='x=1',
+                 headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    resp = conn.getresponse()
+    resp.read()
+    assert resp.status == 404 and conn.sock is sock
+
+    conn.request('GET', '/login', headers={'Connection': 'close'})
+    resp = conn.getresponse()
+    resp.read()
+    assert resp.status == 200 and resp.getheader('Connection') == 'close'
+    conn.close()
+
+def test_slow_unread_body_closes_the_connection():
+    import socket
+    sock = socket.create_connection((SERVER_HOST, SERVER_PORT))
+    sock.sendall(b'POST /nowhere HTTP/1.1\r\nHost: x\r\n'
+                 b'Content-Length: 4000\r\n\r\nx=1')
+    sock.settimeout(5)
+    started = time.monotonic()
+    data = b''
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    sock.close()
+    assert data.startswith(b'HTTP/1.1 404')
+    assert time.monotonic() - started < 3
+
+def test_login_page_is_cached_with_etag():
+    conn = http.client.HTTPConnection(SERVER_HOST, SERVER_PORT)
+    conn.request('GET', '/login')
+    resp = conn.getresponse()
+    body = resp.read()
+    etag = resp.getheader('ETag')
+    assert resp.status == 200 and etag and b'<form' in body
+
+    conn.request('GET', '/login', headers={'If-None-Match': etag})
+    resp = conn.getresponse()
+    assert resp.status == 304 and resp.read() == b''
+    assert resp.getheader('ETag') == etag
+    conn.close()
+
+def test_register_shell_gets_a_fresh_captcha_each_time():
+    ids = {re.search(r'name="captcha_id" value="([^"]+)"', http_get('/register')[1]).group(1)
+           for _ in range(2)}
+    assert len(ids) == 2
+
+def test_login_attempts_are_rate_limited_per_email():
+    statuses = [http_post('/login', {'email': 'flood@example.com', 'password': 'x'})[0]
+                for _ in range(12)]
+    assert statuses[-1] == 429 and 429 not in statuses[:10]
+
+def test_availability_endpoint_reports_each_field():
+    status, body, _ = http_get('/api/availability?username=nobody_here_123&email=bad')
+    assert status == 200
+    assert json.loads(body) == {'username': 'available', 'email': 'invalid'}
+    assert http_get('/api/availability')[0] == 400
+
+def test_oversized_form_body_is_refused():
+    status, _, _ = http_post('/login', {'email': 'a@example.com', 'password': 'x' * 5000})
+    assert status == 413
@@ -0,0 +1,91 @@
+import time
+import asyncio
+import hashlib
+import threading
+import pytest
+
+from hashing import (
+    HashingService, HashingUnavailable, LEGACY_ITERATIONS,
+    pbkdf2, make_hash, decode_hash, calibrate
+)
+
+def test_inline_service_matches_hashlib():
+    service = HashingService(workers=0)
+    dk = service.derive(b'secret', b'salt' * 4, 1000)
+    assert dk == hashlib.pbkdf2_hmac('sha256', b'secret', b'salt' * 4, 1000)
+    stats = service.stats()
+    assert stats['submitted'] == 1 and stats['completed'] == 1
+
+def test_process_pool_service_sync_and_async():
+    service = HashingService(workers=1, queue_size=2, timeout=30)
+    try:
+        expected = pbkdf2(b'pw', b'0123456789abcdef', 1000)
+        assert service.derive(b'pw', b'0123456789abcdef', 1000) == expected
+        got = asyncio.run(service.derive_async(b'pw', b'0123456789abcdef', 1000))
+        assert got == expected
+        stats = service.stats()
+        assert stats['completed'] == 2 and stats['pending'] == 0
+    finally:
+        service.shutdown()
+
+def test_full_queue_rejects():
+    service = HashingService(workers=1, queue_size=0, timeout=0.05)
+    try:
+        # Hold the only slot without going through the pool.
+        service._slots.acquire()
+        with pytest.raises(HashingUnavailable):
+            service.derive(b'pw', b'salt', 1)
+        assert service.stats()['rejected'] == 1
+    finally:
+        service.shutdown()
+
+def test_slot_wait_counts_against_the_timeout():
+    service = HashingService(workers=1, queue_size=0, timeout=0.5)
+    try:
+        # The slot frees up after most of the timeout has gone, leaving
+        # too little for the job itself.
+        service._slots.acquire()
+        threading.Timer(0.4, service._slots.release).start()
+        started = time.monotonic()
+        with pytest.raises(HashingUnavailable):
+            service.run(time.sleep, 0.4)
+        assert time.monotonic() - started < 0.75
+        assert service.stats()['timeouts'] == 1
+    finally:
+        service.shutdown()
+
+def test_encoded_hash_round_trips():
+    stored = make_hash('Str0ng!Pass', 1000)
+    assert stored.startswith(b'pbkdf2_sha256$1000$')
+    algorithm, iterations, salt, dk = decode_hash(stored)
+    assert (algorithm, iterations, len(salt)) == ('pbkdf2_sha256', 1000, 16)
+    assert dk == pbkdf2(b'Str0ng!Pass', salt, 1000)
+
+def test_legacy_hash_decodes_with_legacy_cost():
+    salt = b'0123456789abcdef'
+    legacy = salt + pbkdf2(b'pw', salt, 1)
+    assert decode_hash(legacy) == ('pbkdf2_sha256', LEGACY_ITERATIONS,
+                                   salt, legacy[16:])
+    with pytest.raises(ValueError):
+        decode_hash(b'pbkdf2_sha256$x$y')
+    with pytest.raises(ValueError):
+        decode_hash(b'short')
+
+def test_calibrate_scales_to_target():
+    iterations, per_iteration_ms = calibrate(50, probe_iterations=2000,
+                                             rounds=2, step=100)
+    assert iterations >= 100 and iterations % 100 == 0
+    assert 25 < iterations * per_iteration_ms < 100
+
+def test_share_cores_splits_default_pool(monkeypatch):
+    import hashing
+    service = HashingService(workers=8, queue_size=4)
+    monkeypatch.setattr(hashing, 'service', service)
+    monkeypatch.setattr(hashing, 'HASH_WORKERS', 8)
+    monkeypatch.setattr(hashing, '_WORKERS_SET', False)
+    hashing.share_cores(3)
+    assert (service.workers, service.max_pending) == (2, 6)
+
+    monkeypatch.setattr(hashing, '_WORKERS_SET', True)
+    hashing.share_cores(8)
+    assert service.workers == 2
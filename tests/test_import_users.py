@@ -0,0 +1,62 @@
+import io
+import csv
+import json
+
+from import_users import (
+    read_records, validate, read_checkpoint, write_checkpoint, run_import
+)
+
+def test_read_csv_and_jsonl(tmp_path):
+    csv_path = tmp_path / 'users.csv'
+    csv_path.write_text('username,email,password\nalice,a@example.com,Str0ng!Pass\n')
+    assert list(read_records(str(csv_path), 'csv')) == [
+        (1, {'username': 'alice', 'email': 'a@example.com', 'password': 'Str0ng!Pass'})
+    ]
+
+    jsonl_path = tmp_path / 'users.jsonl'
+    jsonl_path.write_text(json.dumps({'username': 'bob'}) + '\n\nnot json\n')
+    assert list(read_records(str(jsonl_path), 'jsonl')) == [
+        (1, {'username': 'bob'}), (3, None)
+    ]
+
+def test_validate_rows():
+    good = {'username': 'alice', 'email': 'a@example.com', 'password': 'Str0ng!Pass'}
+    assert validate(good) == ('alice', 'a@example.com', 'Str0ng!Pass')
+    assert validate(None) == 'Malformed record'
+    assert validate(dict(good, username='a')) == 'Invalid username'
+    assert validate(dict(good, email='nope')) == 'Invalid email'
+    assert validate(dict(good, password='weak')) == 'Weak password'
+
+def test_checkpoint_roundtrip(tmp_path):
+    path = str(tmp_path / 'import.checkpoint')
+    assert read_checkpoint(path) == 0
+    write_checkpoint(path, 1234)
+    assert read_checkpoint(path) == 1234
+
+def test_rejects_are_written_with_their_checkpoint(sqlite_db, tmp_path):
+    good = 'Str0ng!Pass'
+    path = tmp_path / 'users.csv'
+    path.write_text('username,email,password\n'
+                    f'alice,alice@example.com,{good}\n'
+                    f'bob,nope,{good}\n'
+                    f'ALICE,alice2@example.com,{good}\n'
+                    'carol,carol@example.com,weak\n'
+                    f'd,dave@example.com,{good}\n')
+    checkpoint = str(tmp_path / 'users.checkpoint')
+    rejects    = str(tmp_path / 'users.rejects.csv')
+
+    # The run ends on records that were all rejected; they still get
+    # written and checkpointed.
+    assert run_import(str(path), 'csv', batch_size=2, workers=1,
+                      checkpoint=checkpoint, rejects_path=rejects,
+                      iterations=1, out=io.StringIO()) == (1, 4)
+    assert read_checkpoint(checkpoint) == 5
+    with open(rejects, newline='') as f:
+        assert [(row[0], row[3]) for row in csv.reader(f)] == [
+            ('2', 'Invalid email'), ('3', 'Duplicate username or email'),
+            ('4', 'Weak password'), ('5', 'Invalid username')]
+
+    # Resuming past the checkpoint writes nothing twice.
+    assert run_import(str(path), 'csv', batch_size=2, workers=1,
+                      checkpoint=checkpoint, rejects_path=rejects,
+                      iterations=1, out=io.StringIO()) == (0, 0)
@@ -0,0 +1,41 @@
+import metrics
+from metrics import (
+    Counter, Histogram, RequestTimer, phase, request_timer, scrape_allowed
+)
+
+def test_histogram_exposition_is_cumulative():
+    hist = Histogram('t_seconds', 'Test.', ('route',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        hist.observe(value, '/login')
+    lines = list(hist.expose())
+    assert lines[:3] == ['t_seconds_bucket{route="/login",le="0.1"} 1',
+                         't_seconds_bucket{route="/login",le="1.0"} 3',
+                         't_seconds_bucket{route="/login",le="+Inf"} 4']
+    assert lines[-1] == 't_seconds_count{route="/login"} 4'
+    assert hist.count('/login') == 4
+
+def test_counter_labels_are_escaped():
+    counter = Counter('t_total', 'Test.', ('path',))
+    counter.inc('a"b')
+    counter.inc('a"b', amount=2)
+    assert list(counter.expose()) == ['t_total{path="a\\"b"} 3']
+
+def test_phases_only_recorded_inside_a_request():
+    with phase('db'):
+        pass   # no request: nothing to charge, no error
+    with request_timer() as timer:
+        with phase('db'):
+            pass
+        with phase('db'):
+            pass
+    assert isinstance(timer, RequestTimer) and list(timer.phases) == ['db']
+
+def test_scrape_needs_loopback_or_token(monkeypatch):
+    assert scrape_allowed('127.0.0.1') and scrape_allowed('::1')
+    assert not scrape_allowed('203.0.113.7')
+    assert not scrape_allowed('203.0.113.7', 'Bearer ')
+    assert not scrape_allowed('not an ip')
+
+    monkeypatch.setattr(metrics, 'METRICS_TOKEN', 's3cret')
+    assert scrape_allowed('203.0.113.7', 'Bearer s3cret')
+    assert not scrape_allowed('203.0.113.7', 'Bearer wrong')
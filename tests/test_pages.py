@@ -0,0 +1,16 @@
+import pages
+from pages import get_page
+
+NAV = {'login_link': '', 'register_link': '', 'profile_link': '',
+       'settings_link': '', 'logout_link': ''}
+
+def test_page_rendered_once_and_split_around_hole(monkeypatch):
+    monkeypatch.setattr(pages, '_pages', {})
+    page = get_page('login.html', NAV)
+    assert get_page('login.html', NAV) is page
+    assert len(page.parts) == 1 and page.etag.startswith('"')
+
+    shell = get_page('register.html', NAV, hole='captcha_id')
+    assert shell.etag is None and len(shell.parts) == 3   # img src + hidden input
+    body = b'abc'.join(shell.parts)
+    assert b'/captcha/abc.png' in body and b'value="abc"' in body
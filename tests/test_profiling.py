@@ -0,0 +1,30 @@
+import os
+
+from profiling import Sampler, log_slow_request
+
+def test_sampler_profiles_one_in_n_and_rotates(tmp_path):
+    sampler = Sampler(every=2, min_ms=0, directory=str(tmp_path), keep=2, top=5)
+    written = []
+    for _ in range(8):
+        profiler = sampler.start()
+        if profiler is not None:
+            sum(range(1000))
+            written.append(sampler.finish(profiler, 'GET /login', 0.01))
+    assert len(written) == 4
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        name for path in written[-2:] for name in
+        (os.path.basename(path), os.path.basename(path)[:-4] + '.prof'))
+    assert 'GET /login' in open(written[-1], encoding='utf-8').read()
+
+def test_sampler_drops_fast_requests(tmp_path):
+    sampler = Sampler(every=1, min_ms=500, directory=str(tmp_path))
+    assert sampler.finish(sampler.start(), 'GET /', 0.01) is None
+    assert not os.listdir(tmp_path)
+
+def test_slow_request_log(capsys):
+    assert not log_slow_request('GET', '/', 200, 0.1, {}, 0, 0, threshold_ms=500)
+    assert log_slow_request('POST', '/login', 302, 0.8,
+                            {'hash': 0.7, 'db': 0.01}, 2, 3, threshold_ms=500)
+    line = capsys.readouterr().out
+    assert line.startswith('Slow request: POST /login 302 800.0ms [hash=700.0ms db=10.0ms]')
+    assert 'queries=2 round_trips=3' in line
@@ -0,0 +1,41 @@
+import pytest
+
+from ratelimit import MemoryBucketStore, SQLiteBucketStore, RateLimiter, make_limiter
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteBucketStore(path=str(tmp_path / 'limits.db'))
+    return MemoryBucketStore()
+
+def test_bucket_allows_burst_then_refills(store):
+    # 1 token per second, burst of 3.
+    assert [store.take('k', 1.0, 3, now=100.0) for _ in range(3)] == [0, 0, 0]
+    assert store.take('k', 1.0, 3, now=100.0) == pytest.approx(1.0)
+    assert store.take('k', 1.0, 3, now=101.5) == 0
+    assert store.take('other', 1.0, 3, now=101.5) == 0
+
+def test_limiter_checks_ip_then_email(store):
+    limiter = RateLimiter(store, ip_rule=(60, 5), email_rule=(60, 2))
+    assert limiter.check('1.2.3.4', 'A@example.com', now=0) == 0
+    assert limiter.check('5.6.7.8', 'a@example.com ', now=0) == 0
+    assert limiter.check('9.9.9.9', 'a@example.com', now=0) > 0
+    stats = limiter.stats()
+    assert (stats['allowed'], stats['limited_email']) == (2, 1)
+
+    disabled = RateLimiter(store, ip_rule=(0, 0), email_rule=(0, 0))
+    assert all(disabled.check('1.1.1.1', 'x@example.com', now=0) == 0
+               for _ in range(20))
+
+def test_memory_store_is_bounded():
+    store = MemoryBucketStore(max_keys=2)
+    for key in 'abc':
+        store.take(key, 1.0, 1, now=0)
+    assert len(store) == 2
+
+def test_auto_store_is_shared_across_processes(capsys):
+    assert isinstance(make_limiter(kind='auto').store, MemoryBucketStore)
+    assert isinstance(make_limiter(shared=True, kind='auto').store, SQLiteBucketStore)
+
+    assert isinstance(make_limiter(shared=True, kind='memory').store, MemoryBucketStore)
+    assert 'per process' in capsys.readouterr().out
@@ -0,0 +1,17 @@
+import datetime
+
+import storage
+from reaper import reap_expired_sessions
+
+def test_reaper_removes_only_expired_sessions(sqlite_db):
+    user_id = storage.create_user('reapuser', 'reap@example.com', b'x')
+    past = datetime.datetime.utcnow() - datetime.timedelta(days=2)
+    future = datetime.datetime.utcnow() + datetime.timedelta(days=2)
+    for i in range(5):
+        storage.create_session(f"{i:064x}", user_id, past)
+    storage.create_session("f" * 64, user_id, future)
+
+    assert reap_expired_sessions(batch_size=2, pause=0) == 5
+
+    assert storage.get_session_user("f" * 64)['id'] == user_id
+    assert storage.get_session_user(f"{0:064x}") is None
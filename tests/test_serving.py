@@ -0,0 +1,115 @@
+import signal
+import threading
+import time
+import http.client
+from http.server import BaseHTTPRequestHandler
+
+import serving
+from serving import make_server, KeepAliveMixin, PooledHTTPServer
+
+class SlowHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(0.3)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+def _get(port, results):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('GET', '/')
+    results.append(conn.getresponse().status)
+    conn.close()
+
+def test_pooled_server_handles_requests_concurrently():
+    server = make_server(('127.0.0.1', 0), SlowHandler, threads=4)
+    assert isinstance(server, PooledHTTPServer)
+    port = server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    results = []
+    clients = [threading.Thread(target=_get, args=(port, results)) for _ in range(4)]
+    start = time.monotonic()
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    elapsed = time.monotonic() - start
+
+    server.shutdown()
+    server.server_close()
+    assert results == [200] * 4
+    assert elapsed < 1.0
+
+class KeepAliveHandler(KeepAliveMixin, BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    timeout = 5
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+def test_idle_keep_alive_connections_yield_to_waiting_clients():
+    server = make_server(('127.0.0.1', 0), KeepAliveHandler, threads=2)
+    port = server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        idle = []
+        for _ in range(2):
+            conn = http.client.HTTPConnection('127.0.0.1', port)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            idle.append(conn)
+
+        start = time.monotonic()
+        results = []
+        _get(port, results)
+        assert results == [200]
+        assert time.monotonic() - start < 1.0
+        for conn in idle:
+            conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_keep_alive_connection_serves_pipelined_requests():
+    server = make_server(('127.0.0.1', 0), KeepAliveHandler, threads=2)
+    port = server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        for _ in range(3):
+            conn.request('GET', '/')
+            assert conn.getresponse().read() == b''
+        conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_prefork_gives_up_on_a_worker_that_keeps_failing(monkeypatch, capfd):
+    monkeypatch.setattr(serving, 'RESPAWN_BACKOFF', 0.01)
+    monkeypatch.setattr(serving, 'RESPAWN_MAX_FAILURES', 3)
+    saved = {sig: signal.getsignal(sig) for sig in (signal.SIGTERM, signal.SIGINT)}
+
+    def broken(slot):
+        raise RuntimeError('worker setup failed')
+
+    try:
+        serving.serve_prefork(('127.0.0.1', 0), SlowHandler, workers=1,
+                              on_worker_start=broken)
+    finally:
+        for sig, handler in saved.items():
+            signal.signal(sig, handler)
+
+    out, err = capfd.readouterr()
+    assert err.count('RuntimeError: worker setup failed') == 3
+    assert 'giving up on slot 0' in out
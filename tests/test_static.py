@@ -0,0 +1,88 @@
+import io
+import gzip
+import pytest
+
+import static
+from static import serve_file
+
+class DummyHandler:
+
+    def __init__(self, headers=None):
+        self.headers = headers or {}
+        self.status = None
+        self.sent = {}
+        self.wfile = io.BytesIO()
+        self.connection = None
+
+    def send_response(self, status_code):
+        self.status = status_code
+
+    def send_header(self, key, value):
+        self.sent[key] = value
+
+    def end_headers(self):
+        pass
+
+    def send_error(self, status_code):
+        self.status = status_code
+
+@pytest.fixture
+def root(tmp_path):
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'css' / 'site.css').write_bytes(b'body { color: red; }')
+    (tmp_path / 'app.js').write_bytes(b'x' * 1000)
+    (tmp_path / 'app.js.gz').write_bytes(gzip.compress(b'x' * 1000))
+    (tmp_path / 'big.bin').write_bytes(bytes(range(256)) * 1024)
+    (tmp_path.parent / 'secret.txt').write_bytes(b'nope')
+    return str(tmp_path)
+
+def test_serves_with_validators_and_mime(root):
+    h = DummyHandler()
+    serve_file(h, root, 'css/site.css')
+    assert h.status == 200
+    assert h.sent['Content-Type'].startswith('text/css')
+    assert h.wfile.getvalue() == b'body { color: red; }'
+    assert 'ETag' in h.sent and 'Last-Modified' in h.sent
+
+    again = DummyHandler({'If-None-Match': h.sent['ETag']})
+    serve_file(again, root, 'css/site.css')
+    assert again.status == 304 and again.wfile.getvalue() == b''
+
+    since = DummyHandler({'If-Modified-Since': h.sent['Last-Modified']})
+    serve_file(since, root, 'css/site.css')
+    assert since.status == 304
+
+def test_rejects_traversal_and_missing(root):
+    for rel in ('../secret.txt', '%2e%2e/secret.txt', 'missing.css', '%00',
+                'css/site.css%00.png'):
+        h = DummyHandler()
+        serve_file(h, root, rel)
+        assert h.status == 404
+
+def test_precompressed_variant(root):
+    h = DummyHandler({'Accept-Encoding': 'gzip, deflate'})
+    serve_file(h, root, 'app.js')
+    assert h.sent['Content-Encoding'] == 'gzip'
+    assert h.sent['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(h.wfile.getvalue()) == b'x' * 1000
+
+    plain = DummyHandler()
+    serve_file(plain, root, 'app.js')
+    assert 'Content-Encoding' not in plain.sent
+    assert plain.wfile.getvalue() == b'x' * 1000
+
+def test_ranges(root, monkeypatch):
+    monkeypatch.setattr(static, 'STATIC_CACHE_MAX_FILE', 1024)
+    h = DummyHandler({'Range': 'bytes=10-19'})
+    serve_file(h, root, 'big.bin')
+    assert h.status == 206
+    assert h.sent['Content-Range'] == 'bytes 10-19/262144'
+    assert h.wfile.getvalue() == bytes(range(10, 20))
+
+    tail = DummyHandler({'Range': 'bytes=-4'})
+    serve_file(tail, root, 'big.bin')
+    assert tail.wfile.getvalue() == bytes(range(252, 256))
+
+    bad = DummyHandler({'Range': 'bytes=999999-'})
+    serve_file(bad, root, 'big.bin')
+    assert bad.status == 416
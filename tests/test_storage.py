@@ -0,0 +1,76 @@
+import datetime
+
+import pytest
+
+import db
+import storage
+
+def test_users_and_sessions_on_sqlite(sqlite_db):
+    user_id = storage.create_user('alice', 'alice@example.com', b'\x00hash')
+    with pytest.raises(storage.integrity_errors()):
+        storage.create_user('ALICE', 'other@example.com', b'x')
+
+    assert storage.get_login('alice@example.com') == {'id': user_id,
+                                                      'password_hash': b'\x00hash'}
+    storage.update_username(user_id, 'alice2')
+    storage.bump_session_version(user_id)
+    user = storage.get_user(user_id)
+    assert user['username'] == 'alice2' and user['session_version'] == 1
+    assert isinstance(user['updated_at'], datetime.datetime)
+
+    now = datetime.datetime.utcnow()
+    storage.create_session('a' * 64, user_id, now + datetime.timedelta(days=1))
+    for i in range(3):
+        storage.create_session(f'{i:064x}', user_id, now - datetime.timedelta(days=1))
+
+    row = storage.get_session_user('a' * 64)
+    assert row['id'] == user_id and row['session_expires'] > now
+    assert storage.get_session_user(f'{0:064x}') is None
+
+    assert storage.delete_expired_sessions(2) == 2
+    assert storage.delete_expired_sessions(2) == 1
+    storage.delete_session('a' * 64)
+    assert storage.get_session_user('a' * 64) is None
+
+def test_create_users_skips_duplicates(sqlite_db):
+    storage.create_user('bob', 'bob@example.com', b'x')
+    rows = [('carol', 'carol@example.com', b'x'),
+            ('bob2',  'bob@example.com',   b'x'),
+            ('dave',  'dave@example.com',  b'x')]
+    assert storage.create_users(rows) == [1]
+    assert storage.delete_users_like('%@example.com') == 3
+
+def test_request_scope_shares_one_transaction(sqlite_db):
+    with db.request_scope() as uow:
+        user_id = storage.create_user('erin', 'erin@example.com', b'x')
+        storage.create_session('e' * 64, user_id,
+                               datetime.datetime.utcnow() + datetime.timedelta(days=1))
+        assert storage.get_session_user('e' * 64)['id'] == user_id
+        assert db.pool_stats()['size'] == 1
+    assert (uow.queries, uow.round_trips) == (3, 4)   # + COMMIT
+
+    # A failed statement rolls back everything the request did.
+    with db.request_scope():
+        storage.create_user('frank', 'frank@example.com', b'x')
+        with pytest.raises(storage.integrity_errors()):
+            storage.create_user('erin', 'erin2@example.com', b'x')
+    assert storage.get_login('frank@example.com') is None
+
+def test_on_commit_runs_only_after_a_commit(sqlite_db):
+    ran = []
+    with db.request_scope():
+        storage.create_user('gina', 'gina@example.com', b'x')
+        db.on_commit(lambda: ran.append('gina'))
+        assert ran == []
+    assert ran == ['gina']
+
+    with db.request_scope():
+        storage.create_user('hank', 'hank@example.com', b'x')
+        db.on_commit(lambda: ran.append('hank'))
+        with pytest.raises(storage.integrity_errors()):
+            storage.create_user('gina', 'gina2@example.com', b'x')
+    assert ran == ['gina']
+
+    # Outside a request scope the statement has already committed.
+    db.on_commit(lambda: ran.append('now'))
+    assert ran == ['gina', 'now']
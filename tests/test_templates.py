@@ -0,0 +1,49 @@
+import pytest
+
+import templates
+from templates import render, _load_raw
+
+NAV = {
+    'login_link':    '<a href="/login">Login</a>',
+    'register_link': '<a href="/register">Register</a>',
+    'profile_link':  '',
+    'settings_link': '',
+    'logout_link':   ''
+}
+
+def two_pass_render(name, **context):
+    child = _load_raw(name).format(**context)
+    return _load_raw('base.html').format(**dict(context, content=child)).encode('utf-8')
+
+@pytest.mark.parametrize('name, extra', [
+    ('login.html', {}),
+    ('home.html', {'username': 'zoë'}),
+    ('register.html', {'captcha_id': 'abc'}),
+    ('profile.html', {'id': 7, 'username': 'u', 'email': 'e@x.io',
+                      'created_at': 'then', 'updated_at': 'Never', 'is_active': 'Yes'}),
+])
+def test_compiled_render_matches_two_pass_format(name, extra):
+    assert render(name, **NAV, **extra) == two_pass_render(name, **NAV, **extra)
+
+def test_missing_variable_errors():
+    with pytest.raises(RuntimeError, match='Missing template variable: username in home.html'):
+        render('home.html', **NAV)
+    with pytest.raises(RuntimeError, match='Missing template variable: login_link in base.html'):
+        render('login.html')
+
+def test_missing_template():
+    with pytest.raises(RuntimeError, match='Template not found'):
+        render('nope.html')
+
+def test_reload_mode_picks_up_changes(tmp_path, monkeypatch):
+    (tmp_path / 'base.html').write_text('[{content}]')
+    (tmp_path / 'page.html').write_text('hello {name}')
+    monkeypatch.setattr(templates, 'TEMPLATE_DIR', str(tmp_path))
+    monkeypatch.setattr(templates, 'TEMPLATE_RELOAD', True)
+    monkeypatch.setattr(templates, '_compiled', {})
+    assert render('page.html', name='a') == b'[hello a]'
+
+    import os
+    (tmp_path / 'page.html').write_text('bye {name}')
+    os.utime(tmp_path / 'page.html', ns=(1, 1))
+    assert render('page.html', name='a') == b'[bye a]'
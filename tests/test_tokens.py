@@ -0,0 +1,23 @@
+import time
+
+from tokens import parse_keys, issue, verify
+
+KEYS = parse_keys('k2:new-secret,k1:old-secret')
+
+def test_issue_and_verify_roundtrip():
+    expires = int(time.time()) + 60
+    token = issue(42, expires, 3, keys=KEYS)
+    assert verify(token, keys=KEYS) == {'user_id': 42, 'expires': expires, 'version': 3}
+
+def test_rejects_tampered_expired_and_unknown_key():
+    expires = int(time.time()) + 60
+    token = issue(42, expires, 0, keys=KEYS)
+    assert verify(token.replace('42.', '43.', 1), keys=KEYS) is None
+    assert verify(token, keys=KEYS, now=expires + 1) is None
+    assert verify(token, keys=parse_keys('k2:other')) is None
+    assert verify('garbage', keys=KEYS) is None
+
+def test_old_key_still_verifies_after_rotation():
+    old = parse_keys('k1:old-secret')
+    token = issue(7, int(time.time()) + 60, 0, keys=old)
+    assert verify(token, keys=KEYS)['user_id'] == 7
@@ -76,3 +76,14 @@ def test_send_redirect_and_send_html(monkeypatch):
     assert ('Content-Type', 'text/html; charset=utf-8') in handler._sent_headers
     assert ('Content-Length', str(len(body))) in handler._sent_headers
     assert handler.body == body
+
+def test_send_html_compresses_when_accepted():
+    import gzip
+    body = b"<p>" + b"hello " * 200 + b"</p>"
+    handler = DummyHandler({'Accept-Encoding': 'gzip'})
+    handler.wfile = handler
+    send_html(handler, 200, body)
+    assert ('Content-Encoding', 'gzip') in handler._sent_headers
+    assert ('Vary', 'Accept-Encoding') in handler._sent_headers
+    assert ('Content-Length', str(len(handler.body))) in handler._sent_headers
+    assert gzip.decompress(handler.body) == body
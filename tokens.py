@@ -0,0 +1,73 @@
+# tokens.py
+
+import os
+import hmac
+import time
+import base64
+import hashlib
+
+
+def parse_keys(spec: str) -> dict:
+    """
+    Parse "kid1:secret1,kid2:secret2" into an ordered {kid: secret} dict.
+    The first key signs new tokens; every listed key is accepted when
+    verifying, so keys can be rotated by prepending a new one and dropping
+    the old one once its tokens have expired.
+    """
+    keys = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        kid, sep, secret = item.partition(':')
+        if not sep or not kid or not secret or '.' in kid:
+            raise RuntimeError(f"Malformed session key entry: {kid or item!r}")
+        keys[kid] = secret.encode('utf-8')
+    return keys
+
+
+SESSION_KEYS = parse_keys(os.getenv('SESSION_KEYS', ''))
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _sign(secret: bytes, message: str) -> str:
+    return _b64(hmac.new(secret, message.encode('ascii'), hashlib.sha256).digest())
+
+
+def issue(user_id: int, expires: int, version: int, keys=None) -> str:
+    """Return a token "<user_id>.<expires>.<version>.<kid>.<signature>"."""
+    keys = SESSION_KEYS if keys is None else keys
+    if not keys:
+        raise RuntimeError("Set SESSION_KEYS to use token sessions")
+    kid, secret = next(iter(keys.items()))
+    message = f"{int(user_id)}.{int(expires)}.{int(version)}.{kid}"
+    return f"{message}.{_sign(secret, message)}"
+
+
+def verify(token: str, keys=None, now=None):
+    """
+    Return {'user_id', 'expires', 'version'} for a valid, unexpired token
+    signed with a known key, else None.
+    """
+    keys = SESSION_KEYS if keys is None else keys
+    if not token.isascii():
+        return None
+    message, _, signature = token.rpartition('.')
+    parts = message.split('.')
+    if len(parts) != 4:
+        return None
+    user_id, expires, version, kid = parts
+    secret = keys.get(kid)
+    if secret is None or not hmac.compare_digest(_sign(secret, message), signature):
+        return None
+    try:
+        claims = {
+            'user_id': int(user_id),
+            'expires': int(expires),
+            'version': int(version)
+        }
+    except ValueError:
+        return None
+    if claims['expires'] <= (time.time() if now is None else now):
+        return None
+    return claims
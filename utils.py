@@ -1,14 +1,62 @@
-import urllib.parse
 import http.cookies
 
-def parse_form(handler):
-    length = int(handler.headers.get('Content-Length', 0))
-    raw = handler.rfile.read(length).decode('utf-8')
-    return urllib.parse.parse_qs(raw)
+from metrics import phase
+from forms import FORM_MAX_BODY, FORM_MAX_FIELDS, parse_body
+from compress import COMPRESS_MIN_SIZE, compressible, compress, negotiate
 
-def send_html(handler, status_code, body, content_type='text/html; charset=utf-8'):
-    handler.send_response(status_code)
+def parse_form(handler, max_body=FORM_MAX_BODY, max_fields=FORM_MAX_FIELDS,
+               allow_files=False):
+    """
+    Read the request's form body incrementally, within max_body bytes and
+    max_fields fields. Raises forms.FormError carrying the status to send.
+    """
+    with phase('parse'):
+        return parse_body(handler.rfile, handler.headers, max_body, max_fields,
+                          allow_files=allow_files)
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison: W/ prefixes are ignored.
+    tags = [t.strip() for t in if_none_match.split(',')]
+    return '*' in tags or etag in (t[2:] if t.startswith('W/') else t for t in tags)
+
+def send_html(handler, status_code, body, content_type='text/html; charset=utf-8',
+              cacheable=False, etag=None):
+    """
+    Send body, compressed when the client accepts a coding we have and it is
+    big enough to gain from it. Pass cacheable=True for bodies that are the
+    same bytes on every request, so their compressed form is reused.
+    With an etag, clients revalidate and a matching If-None-Match gets 304.
+    """
+    coding = None
+    vary   = len(body) >= COMPRESS_MIN_SIZE and compressible(content_type)
+    if vary:
+        coding = negotiate(handler.headers.get('Accept-Encoding', ''))
+    if coding:
+        with phase('compress'):
+            encoded = compress(body, coding, cacheable)
+        if len(encoded) < len(body):
+            body = encoded
+        else:
+            coding = None
+
+    if etag and coding:
+        # Each content coding is its own representation with its own tag.
+        etag = f'{etag[:-1]}-{coding}"'
+    not_modified = bool(etag) and _etag_matches(
+        handler.headers.get('If-None-Match', ''), etag)
+
+    handler.send_response(304 if not_modified else status_code)
+    if vary:
+        handler.send_header('Vary', 'Accept-Encoding')
+    if etag:
+        handler.send_header('ETag', etag)
+        handler.send_header('Cache-Control', 'no-cache')
+    if not_modified:
+        handler.end_headers()
+        return
     handler.send_header('Content-Type', content_type)
+    if coding:
+        handler.send_header('Content-Encoding', coding)
     handler.send_header('Content-Length', str(len(body)))
     handler.end_headers()
     handler.wfile.write(body)
@@ -16,13 +64,15 @@ def send_html(handler, status_code, body, content_type='text/html; charset=utf-8
 def send_redirect(handler, location):
     handler.send_response(302)
     handler.send_header('Location', location)
+    handler.send_header('Content-Length', '0')
     handler.end_headers()
 
 def parse_cookies(handler):
-    raw = handler.headers.get('Cookie', '')
-    cookie = http.cookies.SimpleCookie()
-    cookie.load(raw)
-    return cookie
+    with phase('parse'):
+        raw = handler.headers.get('Cookie', '')
+        cookie = http.cookies.SimpleCookie()
+        cookie.load(raw)
+        return cookie
 
 def set_cookie(handler, name, value, path='/', http_only=True, max_age=None):
     cookie = http.cookies.SimpleCookie()